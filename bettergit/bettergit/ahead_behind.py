@@ -0,0 +1,136 @@
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+from .logger import logger
+from .metrics import metrics
+
+LICENSE = """
+Copyright 2023 Dj Padzensky
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software
+without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+CACHE_SIZE = 256
+# Below this much divergence a full rev-list is cheaper than the two smaller
+# walks an incremental update needs.
+INCREMENTAL_THRESHOLD = 64
+
+RunGit = Callable[..., Awaitable[tuple[int, str]]]
+
+
+class AheadBehindCache:
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = maxsize
+        self._counts: OrderedDict[tuple[str, str], tuple[int, int]] = OrderedDict()
+        # The last pair of tips seen for each branch, for incremental updates.
+        self._last: OrderedDict[tuple[Path, str], tuple[str, str]] = OrderedDict()
+
+    def _remember(self, cache: OrderedDict, key, value) -> None:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.maxsize:
+            cache.popitem(last=False)
+
+    @staticmethod
+    async def _advance(
+        run_git: RunGit, old: str, new: str, other: str
+    ) -> Optional[tuple[int, int]]:
+        # Returns how many commits old..new has and how many of those aren't
+        # reachable from other, or None if new doesn't descend from old.
+        rc, stdout = await run_git(
+            "rev-list", "--left-right", "--count", f"{old}...{new}"
+        )
+        if rc != 0:
+            return None
+        removed, added = map(int, stdout.split())
+        if removed:
+            return None
+        if not added:
+            return 0, 0
+        rc, stdout = await run_git("rev-list", "--count", f"{old}..{new}", f"^{other}")
+        if rc != 0:
+            return None
+        return added, int(stdout)
+
+    async def _incremental(
+        self, run_git: RunGit, key: tuple[Path, str], head: str, upstream: str
+    ) -> Optional[tuple[int, int]]:
+        last = self._last.get(key)
+        if last is None:
+            return None
+        last_counts = self._counts.get(last)
+        if last_counts is None or sum(last_counts) < INCREMENTAL_THRESHOLD:
+            return None
+        ahead, behind = last_counts
+        last_head, last_upstream = last
+        if last_upstream == upstream:
+            # New local commits, or HEAD fast-forwarded towards the upstream
+            advanced = await self._advance(run_git, last_head, head, upstream)
+            if advanced is None:
+                return None
+            added, not_upstream = advanced
+            return ahead + not_upstream, behind - (added - not_upstream)
+        if last_head == head:
+            # A fetch moved the upstream forward
+            advanced = await self._advance(run_git, last_upstream, upstream, head)
+            if advanced is None:
+                return None
+            added, not_head = advanced
+            return ahead - (added - not_head), behind + not_head
+        return None
+
+    async def get(
+        self, run_git: RunGit, common_dir: Path, branch: str, head: str, upstream: str
+    ) -> tuple[int, int]:
+        tips = (head, upstream)
+        key = (common_dir, branch)
+        counts = self._counts.get(tips)
+        if counts is not None:
+            metrics.count("ahead_behind.hits")
+            self._counts.move_to_end(tips)
+        else:
+            counts = await self._incremental(run_git, key, head, upstream)
+            if counts is not None:
+                metrics.count("ahead_behind.incremental")
+            else:
+                rc, stdout = await run_git(
+                    "rev-list", "--left-right", "--count", f"{head}...{upstream}"
+                )
+                if rc != 0:
+                    logger.debug("rev-list failed in %s: %s", common_dir, stdout)
+                    return 0, 0
+                counts = tuple(map(int, stdout.split()))
+                metrics.count("ahead_behind.full")
+            self._remember(self._counts, tips, counts)
+        self._remember(self._last, key, tips)
+        logger.debug("ahead/behind for %s %s: %s", common_dir, branch, counts)
+        return counts
+
+
+ahead_behind_cache = AheadBehindCache()
@@ -1,3 +1,4 @@
+import asyncio
 from dataclasses import dataclass
 from typing import TYPE_CHECKING, Optional
 
@@ -14,6 +15,8 @@ CWD_VAR = "user.python_bettergit_cwd"
 class _globals:
     connection: Optional[Connection] = None
     app: Optional[App] = None
+    focus_task: Optional[asyncio.Task] = None
+    metrics_task: Optional[asyncio.Task] = None
 
 
 app_globals = _globals()
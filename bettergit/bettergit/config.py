@@ -33,8 +33,25 @@ THE POSSIBILITY OF SUCH DAMAGE.
 
 CONFIG_DEFAULTS = {
     "debug": False,
+    "trace": False,
     "git_binary": "/usr/bin/git",
+    "persistent_git_helpers": False,
+    "show_metrics": False,
+    "pause_hidden_sessions": True,
+    "metrics_file": "",
+    "max_git_processes": "",
+    "git_timeout": "30",
+    "fetch_timeout": "120",
+    "fetch_interval": "300",
+    "max_concurrent_fetches": "2",
+    "prompt_debounce_ms": "100",
+    "startup_ramp_seconds": "5",
+    "large_repo_index_mb": "32",
+    "large_repo_scan_seconds": "1.5",
+    "large_repo_count_cap": "999",
+    "large_repo_untracked": "defer",
     "icon_fetching": "\N{WATCH}",
+    "icon_stale": "\N{HOURGLASS WITH FLOWING SAND}",
     "icon_status_other": "\u203C\uFE0F",  # Red double exclamation mark
     "icon_status_dirty": "\U0001F534",  # Red circle
     "icon_status_push_or_pull": "\U0001F7E1",  # Yellow circle
@@ -50,6 +67,9 @@ CONFIG_DEFAULTS = {
 
 
 RUNNING_CONFIG = {}
+# Bumped whenever a setting actually changes, so that caches of anything
+# derived from the config know when to let go.
+_config_version = 0
 
 
 def get_config_default(item: str):
@@ -60,7 +80,24 @@ def get_config(item: str):
     return RUNNING_CONFIG.get(item, CONFIG_DEFAULTS[item])
 
 
+def get_config_float(item: str) -> float:
+    try:
+        return float(get_config(item))
+    except (TypeError, ValueError):
+        try:
+            return float(get_config_default(item))
+        except (TypeError, ValueError):
+            return 0.0
+
+
+def get_config_version() -> int:
+    return _config_version
+
+
 def set_config(item: str, value):
+    global _config_version
+    if RUNNING_CONFIG.get(item, CONFIG_DEFAULTS.get(item)) != value:
+        _config_version += 1
     RUNNING_CONFIG[item] = value
 
 
@@ -73,6 +110,56 @@ class StringKnobConfig:
 
 STRING_KNOB_CONFIGS: list[StringKnobConfig] = [
     StringKnobConfig("git_binary", "Git binary", get_config_default("git_binary")),
+    StringKnobConfig("max_git_processes", "Max git processes", "Number of CPUs"),
+    StringKnobConfig("metrics_file", "Metrics file", "Path for a periodic JSON dump"),
+    StringKnobConfig(
+        "git_timeout", "Git timeout (seconds)", get_config_default("git_timeout")
+    ),
+    StringKnobConfig(
+        "fetch_timeout", "Fetch timeout (seconds)", get_config_default("fetch_timeout")
+    ),
+    StringKnobConfig(
+        "fetch_interval",
+        "Fetch interval (seconds)",
+        get_config_default("fetch_interval"),
+    ),
+    StringKnobConfig(
+        "max_concurrent_fetches",
+        "Max concurrent fetches",
+        get_config_default("max_concurrent_fetches"),
+    ),
+    StringKnobConfig(
+        "prompt_debounce_ms",
+        "Prompt debounce (ms)",
+        get_config_default("prompt_debounce_ms"),
+    ),
+    StringKnobConfig(
+        "startup_ramp_seconds",
+        "Startup ramp (seconds)",
+        get_config_default("startup_ramp_seconds"),
+    ),
+    StringKnobConfig(
+        "large_repo_index_mb",
+        "Large repo: index size (MB)",
+        get_config_default("large_repo_index_mb"),
+    ),
+    StringKnobConfig(
+        "large_repo_scan_seconds",
+        "Large repo: scan time (seconds)",
+        get_config_default("large_repo_scan_seconds"),
+    ),
+    StringKnobConfig(
+        "large_repo_count_cap",
+        "Large repo: count cap",
+        get_config_default("large_repo_count_cap"),
+    ),
+    StringKnobConfig(
+        "large_repo_untracked",
+        "Large repo: untracked files (scan, defer, skip)",
+        get_config_default("large_repo_untracked"),
+    ),
+    StringKnobConfig("icon_fetching", "Icon: Fetching"),
+    StringKnobConfig("icon_stale", "Icon: Refreshing counts"),
     StringKnobConfig("icon_status_other", "Icon: Status other"),
     StringKnobConfig("icon_status_dirty", "Icon: Status dirty"),
     StringKnobConfig("icon_status_push_or_pull", "Icon: Status push or pull"),
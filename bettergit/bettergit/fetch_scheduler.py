@@ -0,0 +1,273 @@
+import asyncio
+import hashlib
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+from .config import get_config_float
+from .git_env import GitTimeout
+from .git_metadata import UnsupportedRepository, metadata_reader
+from .logger import logger
+from .metrics import metrics
+from .snapshot import snapshot_store
+from .stat_cache import run_blocking
+
+LICENSE = """
+Copyright 2023 Dj Padzensky
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software
+without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+# Quiet remotes back off to this many times the configured fetch interval, and
+# busy ones speed up to this fraction of it.
+MAX_INTERVAL_FACTOR = 8.0
+MIN_INTERVAL_FACTOR = 0.25
+IDLE_SLOWDOWN = 1.5
+MAX_FAILURE_BACKOFF = 3600.0
+JITTER = 0.1
+MAX_TARGETS = 256
+
+RunGit = Callable[..., Awaitable[tuple[int, str]]]
+
+
+@dataclass
+class _FetchState:
+    url: Optional[str]
+    interval: float
+    next_due: float = 0.0
+    last_fetch: float = 0.0
+    failures: int = 0
+    fetch_head: Optional[str] = None
+    in_flight: bool = False
+
+
+class FetchScheduler:
+    def __init__(self):
+        # Keyed by (common git dir, remote name), so linked worktrees share state.
+        self._states: OrderedDict[tuple[Path, str], _FetchState] = OrderedDict()
+        # The last time anything fetched from a URL, when that clone had fetched
+        # before it, and whether it was news.
+        self._url_activity: OrderedDict[str, tuple[float, float, bool]] = OrderedDict()
+        self._url_locks: OrderedDict[str, asyncio.Lock] = OrderedDict()
+        self._running = 0
+        self._slot_freed = asyncio.Condition()
+
+    @staticmethod
+    def base_interval() -> float:
+        return max(get_config_float("fetch_interval"), 1.0)
+
+    @staticmethod
+    def _jittered(delay: float) -> float:
+        return delay * random.uniform(1.0 - JITTER, 1.0 + JITTER)
+
+    def _state(self, key: tuple[Path, str], url: Optional[str]) -> _FetchState:
+        state = self._states.get(key)
+        if state is None:
+            state = _FetchState(url=url, interval=self.base_interval())
+            saved = snapshot_store.fetch_state(*key)
+            if saved is not None:
+                # Pick up the schedule from the last run rather than fetching
+                # everything at once on startup.
+                state.interval = saved["interval"]
+                state.next_due = saved["next_due"]
+                state.last_fetch = saved["last_fetch"]
+                state.failures = saved["failures"]
+                state.fetch_head = saved["fetch_head"]
+            self._states[key] = state
+            while len(self._states) > MAX_TARGETS:
+                oldest = next(iter(self._states))
+                if self._states[oldest].in_flight:
+                    break
+                del self._states[oldest]
+        if url is not None:
+            state.url = url
+        self._states.move_to_end(key)
+        return state
+
+    @staticmethod
+    async def _remotes(
+        git_dir: Path, common_dir: Path, run_git: RunGit
+    ) -> dict[str, Optional[str]]:
+        try:
+            return await run_blocking(metadata_reader.remotes, git_dir, common_dir)
+        except (OSError, UnicodeDecodeError, UnsupportedRepository) as e:
+            logger.debug("Can't read remotes in %s directly: %s", common_dir, e)
+        rc, stdout = await run_git("remote")
+        return {r: None for r in stdout.split()} if rc == 0 else {}
+
+    def _recently_fetched_elsewhere(self, state: _FetchState, now: float) -> bool:
+        # Another clone of the same remote just fetched and found nothing new
+        # since its previous fetch, which is no older than ours, so there's no
+        # point in asking again yet.
+        activity = self._url_activity.get(state.url) if state.url else None
+        if activity is None:
+            return False
+        fetched_at, previous_fetch, changed = activity
+        if (
+            changed
+            or previous_fetch > state.last_fetch
+            or fetched_at <= state.last_fetch
+        ):
+            return False
+        if fetched_at + state.interval > now:
+            state.next_due = max(state.next_due, fetched_at + state.interval)
+            return True
+        return False
+
+    async def due_remotes(
+        self, git_dir: Path, common_dir: Path, run_git: RunGit
+    ) -> list[str]:
+        now = time.time()
+        due = []
+        for remote, url in (await self._remotes(git_dir, common_dir, run_git)).items():
+            state = self._state((common_dir, remote), url)
+            if state.in_flight or state.next_due > now:
+                continue
+            if self._recently_fetched_elsewhere(state, now):
+                continue
+            due.append(remote)
+        return due
+
+    async def _acquire(self) -> None:
+        async with self._slot_freed:
+            await self._slot_freed.wait_for(
+                lambda: self._running
+                < max(int(get_config_float("max_concurrent_fetches")), 1)
+            )
+            self._running += 1
+
+    async def _release(self) -> None:
+        async with self._slot_freed:
+            self._running -= 1
+            self._slot_freed.notify()
+
+    @staticmethod
+    def _fetch_head(git_dir: Path) -> Optional[str]:
+        try:
+            return hashlib.sha1((git_dir / "FETCH_HEAD").read_bytes()).hexdigest()
+        except OSError:
+            return None
+
+    def _finish(
+        self,
+        key: tuple[Path, str],
+        state: _FetchState,
+        ok: bool,
+        fetch_head: Optional[str],
+    ) -> bool:
+        now = time.time()
+        changed = False
+        base = self.base_interval()
+        metrics.count("fetch.ok" if ok else "fetch.failed")
+        if not ok:
+            state.failures += 1
+            delay = min(base * 2**state.failures, MAX_FAILURE_BACKOFF)
+        else:
+            # With nothing to compare against, the refs may well have moved.
+            known = state.fetch_head is not None
+            changed = not known or fetch_head != state.fetch_head
+            previous_fetch = state.last_fetch
+            state.failures = 0
+            state.fetch_head = fetch_head
+            state.last_fetch = now
+            if not changed:
+                state.interval = min(
+                    state.interval * IDLE_SLOWDOWN, base * MAX_INTERVAL_FACTOR
+                )
+            elif known:
+                state.interval = max(state.interval / 2, base * MIN_INTERVAL_FACTOR)
+            if state.url:
+                self._url_activity[state.url] = (now, previous_fetch, changed)
+                self._url_activity.move_to_end(state.url)
+                while len(self._url_activity) > MAX_TARGETS:
+                    self._url_activity.popitem(last=False)
+            delay = state.interval
+        state.next_due = now + self._jittered(delay)
+        logger.debug(
+            "Next fetch in %.0fs (interval %.0fs, %d failures)",
+            state.next_due - now,
+            state.interval,
+            state.failures,
+        )
+        snapshot_store.record_fetch(
+            *key,
+            {
+                "interval": state.interval,
+                "next_due": state.next_due,
+                "last_fetch": state.last_fetch,
+                "failures": state.failures,
+                "fetch_head": state.fetch_head,
+            },
+        )
+        return changed
+
+    def _url_lock(self, name: str) -> asyncio.Lock:
+        lock = self._url_locks.get(name)
+        if lock is None:
+            lock = self._url_locks[name] = asyncio.Lock()
+            for old in list(self._url_locks)[: -MAX_TARGETS or None]:
+                if not self._url_locks[old].locked():
+                    del self._url_locks[old]
+        self._url_locks.move_to_end(name)
+        return lock
+
+    async def fetch(
+        self, git_dir: Path, common_dir: Path, remote: str, run_git: RunGit
+    ) -> bool:
+        key = (common_dir, remote)
+        state = self._state(key, None)
+        if state.in_flight:
+            return False
+        state.in_flight = True
+        # Clones of the same remote take turns rather than fetching at once.
+        lock = self._url_lock(state.url or f"{common_dir}:{remote}")
+        ok = False
+        fetch_head = None
+        try:
+            async with lock:
+                await self._acquire()
+                try:
+                    logger.debug("Fetching %s in %s", remote, common_dir)
+                    rc, _ = await run_git("fetch", "--quiet", remote, fetch=True)
+                    ok = rc == 0
+                    if ok:
+                        fetch_head = await run_blocking(self._fetch_head, git_dir)
+                except GitTimeout:
+                    logger.warning("Gave up fetching %s in %s", remote, common_dir)
+                finally:
+                    await self._release()
+        finally:
+            state.in_flight = False
+            changed = self._finish(key, state, ok, fetch_head)
+        return changed
+
+
+fetch_scheduler = FetchScheduler()
@@ -0,0 +1,97 @@
+import os
+from os import PathLike
+from pathlib import Path
+from typing import Optional
+
+from .git_metadata import UnsupportedRepository, metadata_reader
+from .stat_cache import stat_cache
+
+LICENSE = """
+Copyright 2023 Dj Padzensky
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software
+without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+# Files under the git dir whose metadata changes whenever anything we display
+# could have changed.
+GIT_DIR_FILES = (
+    "index",
+    "HEAD",
+    "FETCH_HEAD",
+    "rebase-merge",
+    "rebase-apply",
+    "MERGE_HEAD",
+    "CHERRY_PICK_HEAD",
+    "REVERT_HEAD",
+    "BISECT_LOG",
+)
+# The same, but for files shared by all worktrees of a repository.
+COMMON_DIR_FILES = ("packed-refs", "refs/stash")
+
+Fingerprint = tuple
+
+
+def _stat_key(path: PathLike | str) -> Optional[tuple[int, int, int]]:
+    st = stat_cache.stat(path)
+    if st is None:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def _current_ref(git_dir: Path) -> Optional[str]:
+    try:
+        head = (git_dir / "HEAD").read_text(encoding="utf-8").strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+    if head.startswith("ref: "):
+        return head[5:]
+    return None
+
+
+def repo_fingerprint(
+    worktree: Path, git_dir: Path, common_dir: Optional[Path] = None
+) -> Fingerprint:
+    if common_dir is None:
+        common_dir = git_dir
+    paths = [worktree]
+    paths.extend(git_dir / f for f in GIT_DIR_FILES)
+    paths.extend(common_dir / f for f in COMMON_DIR_FILES)
+    ref = _current_ref(git_dir)
+    if ref is not None:
+        paths.append(common_dir / ref)
+        if ref.startswith("refs/heads/"):
+            # A push moves the upstream ref without touching anything else.
+            try:
+                upstream = metadata_reader.upstream(
+                    git_dir, common_dir, ref[len("refs/heads/") :]
+                )
+            except (OSError, UnicodeDecodeError, UnsupportedRepository):
+                upstream = None
+            if upstream is not None:
+                paths.append(common_dir / upstream[0])
+    return tuple(_stat_key(p) for p in paths) + (ref,)
@@ -0,0 +1,47 @@
+import asyncio
+from typing import Optional
+
+from iterm2 import App, FocusMonitor, FocusUpdateWindowChanged, Tab, Window
+
+from .app_globals import app_globals
+from .git_scheduler import git_scheduler
+from .logger import logger
+from .visibility import visibility
+
+
+def _tab_session_id(tab: Optional[Tab]) -> Optional[str]:
+    if tab is None or tab.current_session is None:
+        return None
+    return tab.current_session.session_id
+
+
+def _window_session_id(window: Optional[Window]) -> Optional[str]:
+    return _tab_session_id(window.current_tab) if window is not None else None
+
+
+def _set_focused(app: App, session_id: Optional[str]) -> None:
+    git_scheduler.set_focused(session_id)
+    visibility.update(app, session_id)
+
+
+async def focus_monitor():
+    app = app_globals.app
+    _set_focused(app, _window_session_id(app.current_terminal_window))
+    try:
+        async with FocusMonitor(app_globals.connection) as mon:
+            while True:
+                update = await mon.async_get_next_update()
+                if update.active_session_changed:
+                    _set_focused(app, update.active_session_changed.session_id)
+                elif update.selected_tab_changed:
+                    tab = app.get_tab_by_id(update.selected_tab_changed.tab_id)
+                    _set_focused(app, _tab_session_id(tab))
+                elif (
+                    update.window_changed
+                    and update.window_changed.event
+                    == FocusUpdateWindowChanged.Reason.TERMINAL_WINDOW_BECAME_KEY
+                ):
+                    window = app.get_window_by_id(update.window_changed.window_id)
+                    _set_focused(app, _window_session_id(window))
+    except asyncio.CancelledError:
+        logger.debug("Ending focus monitor")
@@ -0,0 +1,86 @@
+import os
+import shutil
+from pathlib import Path
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+from .config import get_config
+from .logger import logger
+
+LICENSE = """
+Copyright 2023 Dj Padzensky
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software
+without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+GIT_ENV_OVERRIDES = {
+    # Status refreshes must never take index.lock away from the user's own git.
+    "GIT_OPTIONAL_LOCKS": "0",
+    # Background fetches can't answer a credential prompt.
+    "GIT_TERMINAL_PROMPT": "0",
+}
+
+
+class GitTimeout(Exception):
+    pass
+
+
+class GitEnvironment:
+    def __init__(self):
+        self._binary: Optional[str] = None
+        self._resolved: Optional[tuple[str, Mapping[str, str]]] = None
+
+    def resolve(self) -> tuple[str, Mapping[str, str]]:
+        git_binary = get_config("git_binary")
+        if git_binary != self._binary or self._resolved is None:
+            # Only redone when the git_binary knob changes.
+            self._resolved = self._resolve(git_binary)
+            self._binary = git_binary
+        return self._resolved
+
+    @staticmethod
+    def _resolve(git_binary: str) -> tuple[str, Mapping[str, str]]:
+        env = dict(os.environ)
+        if Path(git_binary).is_absolute():
+            if not Path(git_binary).is_file():
+                raise FileNotFoundError(f"git binary {git_binary} not found")
+            executable = git_binary
+            # So that git finds its own helpers next to it.
+            path = env.get("PATH", os.defpath).split(os.pathsep)
+            path.append(str(Path(git_binary).parent))
+            env["PATH"] = os.pathsep.join(path)
+        else:
+            executable = shutil.which(git_binary)
+            if executable is None:
+                raise FileNotFoundError(f"git binary {git_binary} not found")
+        env.update(GIT_ENV_OVERRIDES)
+        logger.info("Using git at %s", executable)
+        return executable, MappingProxyType(env)
+
+
+git_environment = GitEnvironment()
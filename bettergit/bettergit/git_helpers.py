@@ -0,0 +1,173 @@
+import asyncio
+from asyncio.subprocess import DEVNULL, PIPE
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from .config import get_config
+from .git_env import git_environment
+from .logger import logger
+from .metrics import metrics
+
+LICENSE = """
+Copyright 2023 Dj Padzensky
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software
+without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+MAX_HELPERS_PER_REPO = 2
+MAX_REPOS = 32
+IDLE_TIMEOUT = 60.0
+# Bounds a single lookup, so a wedged helper is replaced instead of stalling.
+LOOKUP_TIMEOUT = 5.0
+
+
+class HelperDied(Exception):
+    pass
+
+
+@dataclass
+class _Helper:
+    proc: asyncio.subprocess.Process
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    last_used: float = 0.0
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.returncode is None
+
+    def close(self) -> None:
+        if self.alive:
+            self.proc.kill()
+
+    async def lookup(self, revs: tuple[str, ...]) -> list[Optional[str]]:
+        try:
+            self.proc.stdin.write("".join(f"{rev}\n" for rev in revs).encode())
+            await self.proc.stdin.drain()
+            lines = [
+                (await self.proc.stdout.readuntil(b"\n")).decode().rstrip("\n")
+                for _ in revs
+            ]
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+            self.close()
+            raise HelperDied(e) from e
+        self.last_used = asyncio.get_event_loop().time()
+        return [
+            None if line.endswith((" missing", " ambiguous")) else line
+            for line in lines
+        ]
+
+
+class GitHelpers:
+    def __init__(self):
+        # Keyed by (repository root, git binary).
+        self._pools: OrderedDict[tuple[Path, str], list[_Helper]] = OrderedDict()
+        self._reaper: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def enabled() -> bool:
+        return get_config("persistent_git_helpers") == 1
+
+    async def _spawn(self, repo_root: Path) -> _Helper:
+        logger.debug("Starting git helper in %s", repo_root)
+        git, env = git_environment.resolve()
+        proc = await asyncio.create_subprocess_exec(
+            git,
+            "cat-file",
+            "--batch-check=%(objectname)",
+            cwd=repo_root,
+            env=env,
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=DEVNULL,
+        )
+        metrics.count("git_helpers.spawned")
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap())
+        return _Helper(proc, last_used=asyncio.get_event_loop().time())
+
+    async def _helper(self, repo_root: Path, git_binary: str) -> _Helper:
+        key = (repo_root, git_binary)
+        pool = self._pools.setdefault(key, [])
+        self._pools.move_to_end(key)
+        pool[:] = [h for h in pool if h.alive]
+        idle = [h for h in pool if not h.lock.locked()]
+        if idle:
+            return idle[0]
+        if len(pool) < MAX_HELPERS_PER_REPO:
+            helper = await self._spawn(repo_root)
+            pool.append(helper)
+            self._evict_repos()
+            return helper
+        return min(pool, key=lambda h: h.last_used)
+
+    def _evict_repos(self) -> None:
+        for key in list(self._pools)[: -MAX_REPOS or None]:
+            pool = self._pools[key]
+            if any(h.lock.locked() for h in pool):
+                continue
+            for helper in pool:
+                helper.close()
+            del self._pools[key]
+
+    async def resolve(
+        self, repo_root: Path, *revs: str
+    ) -> Optional[list[Optional[str]]]:
+        if not self.enabled():
+            return None
+        git_binary = get_config("git_binary")
+        # A helper that died since it was last used gets one replacement.
+        for attempt in range(2):
+            helper = await self._helper(repo_root, git_binary)
+            async with helper.lock:
+                try:
+                    with metrics.timer("git_helpers.lookup"):
+                        return await asyncio.wait_for(
+                            helper.lookup(revs), LOOKUP_TIMEOUT
+                        )
+                except (HelperDied, asyncio.TimeoutError) as e:
+                    helper.close()
+                    logger.debug("git helper in %s died: %r", repo_root, e)
+        return None
+
+    async def _reap(self) -> None:
+        loop = asyncio.get_event_loop()
+        while self._pools:
+            await asyncio.sleep(IDLE_TIMEOUT / 2)
+            cutoff = loop.time() - IDLE_TIMEOUT
+            for key, pool in list(self._pools.items()):
+                for helper in pool:
+                    if not helper.lock.locked() and helper.last_used < cutoff:
+                        helper.close()
+                pool[:] = [h for h in pool if h.alive]
+                if not pool:
+                    del self._pools[key]
+
+
+git_helpers = GitHelpers()
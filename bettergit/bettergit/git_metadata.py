@@ -0,0 +1,227 @@
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+LICENSE = """
+Copyright 2023 Dj Padzensky
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software
+without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+# How many levels of symbolic refs we follow before giving up, like git does.
+MAX_SYMREF_DEPTH = 5
+
+
+# Raised when the repository needs git itself to be read correctly
+class UnsupportedRepository(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class HeadInfo:
+    branch: Optional[str]  # None when HEAD is detached
+    sha: Optional[str]  # None on an unborn branch
+
+
+def _stat_key(path: Path) -> Optional[tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def _unquote(value: str) -> str:
+    value = value.strip()
+    if value.startswith('"'):
+        end = value.find('"', 1)
+        if end < 0 or "\\" in value[:end]:
+            raise UnsupportedRepository(f"can't parse config value {value}")
+        return value[1:end]
+    for comment in (" #", " ;", "\t#", "\t;"):
+        value = value.split(comment, 1)[0]
+    return value.strip()
+
+
+def _parse_config(text: str) -> dict[tuple[str, Optional[str], str], list[str]]:
+    config = {}
+    section, subsection = None, None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line[0] in "#;":
+            continue
+        if line.startswith("["):
+            header, _, rest = line[1:].partition("]")
+            if rest.strip() and rest.strip()[0] not in "#;":
+                raise UnsupportedRepository(f"can't parse config line {line}")
+            name, _, sub = header.partition(" ")
+            if sub:
+                sub = sub.strip()
+                if not (sub.startswith('"') and sub.endswith('"')):
+                    raise UnsupportedRepository(f"can't parse config line {line}")
+                section, subsection = name.lower(), sub[1:-1]
+            elif "." in name:
+                # Deprecated [section.subsection] syntax
+                name, _, sub = name.partition(".")
+                section, subsection = name.lower(), sub.lower()
+            else:
+                section, subsection = name.lower(), None
+            if section in ("include", "includeif"):
+                raise UnsupportedRepository("config includes other files")
+            continue
+        if section is None or line.endswith("\\"):
+            raise UnsupportedRepository(f"can't parse config line {line}")
+        key, eq, value = line.partition("=")
+        key = key.strip().lower()
+        config.setdefault((section, subsection, key), [])
+        config[(section, subsection, key)].append(_unquote(value) if eq else "true")
+    return config
+
+
+def _map_refspec(refspec: str, ref: str) -> Optional[str]:
+    src, _, dst = refspec.lstrip("+").partition(":")
+    if "*" not in src:
+        return dst if src == ref else None
+    prefix, _, suffix = src.partition("*")
+    if not (ref.startswith(prefix) and ref.endswith(suffix)):
+        return None
+    middle = ref[len(prefix) : len(ref) - len(suffix)]
+    return dst.replace("*", middle, 1)
+
+
+class GitMetadataReader:
+    def __init__(self):
+        self._packed_refs: dict[Path, tuple[tuple, dict[str, str]]] = {}
+        self._configs: dict[Path, tuple[tuple, dict]] = {}
+
+    def _config(self, common_dir: Path) -> dict:
+        path = common_dir / "config"
+        key = _stat_key(path)
+        cached = self._configs.get(path)
+        if cached is None or cached[0] != key:
+            text = path.read_text(encoding="utf-8") if key is not None else ""
+            cached = (key, _parse_config(text))
+            self._configs[path] = cached
+        config = cached[1]
+        if config.get(("extensions", None, "refstorage"), ["files"])[-1] != "files":
+            raise UnsupportedRepository("refs are not stored as files")
+        return config
+
+    def _packed(self, common_dir: Path) -> dict[str, str]:
+        path = common_dir / "packed-refs"
+        key = _stat_key(path)
+        cached = self._packed_refs.get(path)
+        if cached is None or cached[0] != key:
+            refs = {}
+            if key is not None:
+                for line in path.read_text(encoding="ascii").splitlines():
+                    if not line or line[0] in "#^":
+                        continue
+                    sha, _, ref = line.partition(" ")
+                    refs[ref] = sha
+            cached = (key, refs)
+            self._packed_refs[path] = cached
+        return cached[1]
+
+    def _read_ref(self, git_dir: Path, common_dir: Path, ref: str) -> Optional[str]:
+        for _ in range(MAX_SYMREF_DEPTH):
+            # Per-worktree refs (HEAD and friends) live in the git dir.
+            base = common_dir if ref.startswith("refs/") else git_dir
+            try:
+                value = (base / ref).read_text(encoding="ascii").strip()
+            except FileNotFoundError:
+                return self._packed(common_dir).get(ref)
+            except IsADirectoryError:
+                return None
+            if not value.startswith("ref: "):
+                return value
+            ref = value[5:]
+        raise UnsupportedRepository(f"symbolic ref {ref} is too deep")
+
+    def head(self, git_dir: Path, common_dir: Optional[Path] = None) -> HeadInfo:
+        if common_dir is None:
+            common_dir = git_dir
+        self._config(common_dir)  # Bails out on non-files ref storage
+        head = (git_dir / "HEAD").read_text(encoding="ascii").strip()
+        if not head.startswith("ref: "):
+            return HeadInfo(branch=None, sha=head)
+        ref = head[5:]
+        if not ref.startswith("refs/heads/"):
+            raise UnsupportedRepository(f"HEAD points at {ref}")
+        return HeadInfo(
+            branch=ref[len("refs/heads/") :],
+            sha=self._read_ref(git_dir, common_dir, ref),
+        )
+
+    def upstream(
+        self, git_dir: Path, common_dir: Optional[Path], branch: str
+    ) -> Optional[tuple[str, Optional[str]]]:
+        if common_dir is None:
+            common_dir = git_dir
+        config = self._config(common_dir)
+        remote = config.get(("branch", branch, "remote"), [None])[-1]
+        merge = config.get(("branch", branch, "merge"), [None])[-1]
+        if remote is None or merge is None:
+            return None
+        if remote == ".":
+            tracking = merge
+        else:
+            tracking = None
+            for refspec in config.get(("remote", remote, "fetch"), []):
+                tracking = _map_refspec(refspec, merge)
+                if tracking is not None:
+                    break
+            if tracking is None:
+                raise UnsupportedRepository(f"can't map {merge} from {remote}")
+        return tracking, self._read_ref(git_dir, common_dir, tracking)
+
+    def remotes(
+        self, git_dir: Path, common_dir: Optional[Path] = None
+    ) -> dict[str, Optional[str]]:
+        config = self._config(common_dir if common_dir is not None else git_dir)
+        return {
+            sub: values[-1]
+            for (section, sub, key), values in config.items()
+            if section == "remote" and key == "url"
+        }
+
+    def stash_count(self, git_dir: Path, common_dir: Optional[Path] = None) -> int:
+        if common_dir is None:
+            common_dir = git_dir
+        self._config(common_dir)
+        if self._read_ref(git_dir, common_dir, "refs/stash") is None:
+            return 0
+        try:
+            with open(common_dir / "logs" / "refs" / "stash", "rb") as f:
+                return sum(1 for _ in f)
+        except FileNotFoundError:
+            raise UnsupportedRepository("refs/stash has no reflog") from None
+
+
+metadata_reader = GitMetadataReader()
@@ -1,14 +1,32 @@
 import asyncio
 import dataclasses
-import shutil
+import os
+import signal
 from asyncio import Future
-from os import PathLike, defpath, environ, getenv, pathsep
+from collections import OrderedDict
+from functools import partial
+from os import PathLike
 from pathlib import Path
-from typing import Awaitable, Callable, Optional
+from typing import Awaitable, Callable, Mapping, Optional
 
-from .config import get_config
+from .ahead_behind import ahead_behind_cache
+from .config import get_config, get_config_float
+from .fetch_scheduler import fetch_scheduler
+from .git_env import GitTimeout, git_environment
+from .git_helpers import git_helpers
+from .git_metadata import UnsupportedRepository, metadata_reader
+from .git_scheduler import git_scheduler
+from .large_repo import RepoPolicy, large_repo_policies
 from .logger import logger
+from .metrics import metrics
+from .repo_hub import repo_hub
 from .repo_status import RepoStatus
+from .stat_cache import run_blocking, stat_cache
+from .status_parser import StatusParser, UntrackedParser
+from .tracing import tracer
+from .utils import RepoPaths
+from .visibility import visibility
+from .warmup import warm_up
 
 LICENSE = """
 Copyright 2023 Dj Padzensky
@@ -41,9 +59,37 @@ ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
 THE POSSIBILITY OF SUCH DAMAGE.
 """
 
-POLLING_INTERVAL = 10  # 5 minutes
+# `git status --porcelain=v2` only reports "# stash" headers as of git 2.35.
+PORCELAIN_V2_MIN_VERSION = (2, 35)
+STREAM_CHUNK_SIZE = 64 * 1024
+# Collectors that only look at files under .git, run ahead of the rest.
+FAST_COLLECTORS = ("collect_repo_state",)
+# The per-field collectors that a single porcelain v2 invocation replaces.
+PORCELAIN_V2_COLLECTORS = {
+    "collect_repo_counts",
+    "collect_current_branch",
+    "collect_stashes",
+}
 
-last_poll: dict[Path, float] = {}
+TRACKING_REF_CACHE_SIZE = 256
+
+git_versions: dict[str, Optional[tuple[int, ...]]] = {}
+# Upstream ref names worked out by git, for repositories whose config can't be
+# read directly, keyed by the HEAD and config they came from.
+tracking_refs: OrderedDict[tuple, Optional[str]] = OrderedDict()
+
+
+def _parse_git_version(version: str) -> Optional[tuple[int, ...]]:
+    # "git version 2.39.5", "git version 2.39.3 (Apple Git-145)"
+    words = version.split()
+    if len(words) < 3 or words[:2] != ["git", "version"]:
+        return None
+    numbers = []
+    for n in words[2].split("."):
+        if not n.isdigit():
+            break
+        numbers.append(int(n))
+    return tuple(numbers) or None
 
 
 class GitPoller:
@@ -51,6 +97,7 @@ class GitPoller:
         self, session_id: str, update_trigger: Callable[[RepoStatus], Awaitable[any]]
     ):
         self._repo_root = None
+        self._repo: Optional[RepoPaths] = None
         self.session_id = session_id
         self.update_trigger = update_trigger
         self._repo_status = None
@@ -59,6 +106,8 @@ class GitPoller:
         ]
         self._fetch_future: Optional[Future] = None
         self._time_to_clear_repo_status = True
+        # Set while only the fast tier is being kept up to date.
+        self._paused = False
 
     async def clear_repo_status(self) -> None:
         self._time_to_clear_repo_status = False
@@ -66,8 +115,14 @@ class GitPoller:
         await self.update_trigger(self._repo_status)
 
     async def update_repo_status(self, new_values: dict[str, any]) -> None:
+        if self._repo_status is None:
+            return
         new_status = dataclasses.replace(self._repo_status, **new_values)
-        logger.debug("%s: New status: %s", self.session_id, new_status)
+        if tracer.enabled:
+            changed = [
+                k for k, v in new_values.items() if getattr(self._repo_status, k) != v
+            ]
+            tracer.event("status", self.session_id, self.repo_root, changed=changed)
         if new_status != self._repo_status:
             self._repo_status = new_status
             await self.update_trigger(self._repo_status)
@@ -83,185 +138,564 @@ class GitPoller:
         if new_value != self._repo_root:
             logger.debug("%s: this is a change", self.session_id)
             self._time_to_clear_repo_status = True
+            if self._repo_root is not None:
+                repo_hub.unsubscribe(self, self._repo_root)
             self._repo_root = new_value
+            self._repo = None
+            if new_value is not None:
+                repo_hub.subscribe(self, new_value)
+            git_scheduler.cancel_stale(self.session_id, new_value)
             self._fetch_future = None
         logger.debug("%s: set root", self.session_id)
 
-    async def _do_fetch(self) -> None:
-        cur_root = self.repo_root
-        logger.debug("%s: Fetching in %s", self.session_id, cur_root)
-        await self._run_git_command("fetch", "--quiet")
-        last_poll[cur_root] = asyncio.get_event_loop().time()
+    @property
+    def repo(self) -> Optional[RepoPaths]:
+        return self._repo
+
+    @repo.setter
+    def repo(self, value: Optional[RepoPaths]):
+        self.repo_root = value.worktree if value is not None else None
+        self._repo = value
+
+    @property
+    def git_dir(self) -> Optional[Path]:
+        if self._repo is not None:
+            return self._repo.git_dir
+        return self._repo_root / ".git" if self._repo_root is not None else None
+
+    @property
+    def common_dir(self) -> Optional[Path]:
+        if self._repo is not None:
+            return self._repo.common_dir
+        return self.git_dir
+
+    @property
+    def paths(self) -> Optional[RepoPaths]:
+        # Collections hold on to these, so that a cd part of the way through
+        # can't point the rest of them at another repository.
+        if self._repo is not None:
+            return self._repo
+        if self._repo_root is None:
+            return None
+        return RepoPaths(self._repo_root, self.git_dir, self.common_dir)
+
+    async def _do_fetch(self, repo: RepoPaths, remotes: list[str]) -> None:
+        cur_root = repo.worktree
+        logger.debug("%s: Fetching %s in %s", self.session_id, remotes, cur_root)
+        run_git = partial(self._run_git_command, repo=repo)
+        changed = []
+        try:
+            changed = await asyncio.gather(
+                *[
+                    fetch_scheduler.fetch(repo.git_dir, repo.common_dir, r, run_git)
+                    for r in remotes
+                ]
+            )
+        except Exception:
+            logger.exception("%s: Fetching failed in %s", self.session_id, cur_root)
         logger.debug("%s: Done fetching in %s", self.session_id, cur_root)
-        if self.repo_root == cur_root and self.update_trigger:
-            logger.debug("triggering update for %s", self.session_id)
-            await self.update_trigger(self._repo_status)
+        if self.repo_root != cur_root:
+            return
+        await self.update_repo_status({"fetching": False})
+        if any(changed):
+            # FETCH_HEAD moved, so ahead/behind may have too.
+            try:
+                await self.collect()
+            except Exception:
+                logger.exception("%s: Collecting after fetch failed", self.session_id)
 
     async def collect(self) -> None:
         logger.debug("%s: Collecting", self.session_id)
-        if (
+        cleared = (
             self._time_to_clear_repo_status
             or self._repo_status.repo_root != self.repo_root
-        ):
+        )
+        if cleared:
             await self.clear_repo_status()
         self._repo_status.repo_root = self.repo_root
-        if self.repo_root is None:
+        repo = self.paths
+        if repo is None:
             logger.debug("%s: No repo root", self.session_id)
             return
-        logger.debug("%s: Repo root is %s", self.session_id, self.repo_root)
-        if self._fetch_future is not None:
-            await self._fetch_future
-            self._fetch_future = None
-        _, stdout = await self._run_git_command("remote", "show")
-        if stdout.strip() and (
-            last_poll.setdefault(self.repo_root, 0) + POLLING_INTERVAL
-            < asyncio.get_event_loop().time()
-        ):
-            if self._fetch_future is None:
-                self._fetch_future = asyncio.create_task(self._do_fetch())
-                logger.debug("%s: created: %s", self.session_id, self._fetch_future)
+        hidden = visibility.is_hidden(self.session_id)
+        cached = repo_hub.peek(repo.worktree) if cleared or self._paused else None
+        if cached is not None:
+            # Show what we last knew about the repository while it's rechecked.
+            await self.update_repo_status({**cached, "stale": True})
+        await warm_up.wait(self.session_id, repo.worktree)
+        if self.repo_root != repo.worktree:
+            return
+        logger.debug("%s: Repo root is %s", self.session_id, repo.worktree)
+        # Fetches run alongside collections; the status shows one is going on
+        # until it finishes.
+        # Background sessions don't fetch; they catch up when they're shown.
+        if not hidden and (self._fetch_future is None or self._fetch_future.done()):
+            remotes = await fetch_scheduler.due_remotes(
+                repo.git_dir,
+                repo.common_dir,
+                partial(self._run_git_command, repo=repo),
+            )
+            if self.repo_root != repo.worktree:
+                return
+            if remotes:
+                self._fetch_future = asyncio.create_task(self._do_fetch(repo, remotes))
+                await self.update_repo_status({"fetching": True})
+        res = await repo_hub.collect(self, repo, start=not hidden)
+        if self.repo_root != repo.worktree:
+            logger.debug("%s: Moved on from %s", self.session_id, repo.worktree)
+            return
+        if res is None and hidden:
+            # Nothing current to share and nobody looking, so only the fast tier
+            # is kept up to date until the session is shown again.
+            logger.debug("%s: Hidden; not scanning", self.session_id)
+            metrics.count("visibility.paused")
+            self._paused = True
+            fast = await self._collect_fast(repo)
+            if self.repo_root == repo.worktree:
+                await self.update_repo_status({**fast, "stale": True})
+            return
+        self._paused = False
+        if res is None:
+            logger.debug("%s: Collection was abandoned", self.session_id)
+            return
+        # noinspection PyArgumentList
+        await self.update_repo_status({**res, "stale": False})
+        warm_up.finished(self.session_id, repo.worktree)
+
+    async def run_collectors(
+        self,
+        repo: RepoPaths,
+        on_fast: Optional[Callable[[dict[str, any]], Awaitable]] = None,
+    ) -> dict[str, any]:
         logger.debug("%s: Running collection methods", self.session_id)
-        results = await asyncio.gather(
-            *[asyncio.create_task(x()) for x in self.collection_methods]
-        )
-        res = {}
-        for r in results:
+        methods = [
+            x for x in self.collection_methods if x.__name__ not in FAST_COLLECTORS
+        ]
+        if await self._supports_porcelain_v2(repo):
+            methods = [
+                x for x in methods if x.__name__ not in PORCELAIN_V2_COLLECTORS
+            ] + [self._collect_porcelain_v2]
+        with tracer.span("collect", self.session_id, repo.worktree) as span:
+            slow = [asyncio.create_task(self._timed(x, repo)) for x in methods]
+            try:
+                # The fast tier only reads files under .git, so it can be shown
+                # while git status is still running.
+                res = await self._collect_fast(repo)
+                if on_fast is not None:
+                    await on_fast(res)
+                results = await asyncio.gather(*slow)
+            except BaseException:
+                for task in slow:
+                    task.cancel()
+                raise
+            res = dict(res)
+            for r in results:
+                res.update(r)
+            span.set(fields=len(res))
+        return res
+
+    async def _collect_fast(self, repo: RepoPaths) -> dict[str, any]:
+        res = await run_blocking(self._read_refs, repo)
+        for r in await asyncio.gather(
+            *[self._timed(getattr(self, x), repo) for x in FAST_COLLECTORS]
+        ):
             res.update(r)
-        logger.debug("%s: Collection results: %s", self.session_id, res)
-        # noinspection PyArgumentList
-        await self.update_repo_status(res)
+        return res
+
+    def _read_refs(self, repo: RepoPaths) -> dict[str, any]:
+        try:
+            head = metadata_reader.head(repo.git_dir, repo.common_dir)
+            stashes = metadata_reader.stash_count(repo.git_dir, repo.common_dir)
+        except (OSError, UnicodeDecodeError, UnsupportedRepository) as e:
+            logger.debug("%s: No fast branch and stashes: %s", self.session_id, e)
+            return {}
+        if head.branch is not None:
+            return {"current_branch": head.branch, "stashes": stashes}
+        return {"current_branch": f"[{head.sha[:7]}]", "stashes": stashes}
+
+    @staticmethod
+    async def _timed(method: Callable[..., Awaitable[dict]], *args) -> dict:
+        with metrics.timer(f"collector.{method.__name__.lstrip('_')}"):
+            return await method(*args)
+
+    @staticmethod
+    async def _kill(proc: asyncio.subprocess.Process) -> None:
+        # git may have started ssh, credential helpers or hooks of its own.
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        await proc.wait()
+
+    @staticmethod
+    async def _stream_output(
+        proc: asyncio.subprocess.Process, on_output: Callable[[bytes], bool]
+    ) -> tuple[bytes, bytes]:
+        stderr = asyncio.ensure_future(proc.stderr.read())
+        try:
+            while chunk := await proc.stdout.read(STREAM_CHUNK_SIZE):
+                metrics.count("process.bytes_read", len(chunk))
+                if not on_output(chunk):
+                    # The caller has seen enough; don't wait for git to finish.
+                    proc.kill()
+                    break
+            await proc.wait()
+            return b"", await stderr
+        finally:
+            stderr.cancel()
 
     async def _run_command(
-        self, command: str | PathLike, /, *args, cwd: Path
+        self,
+        command: str | PathLike,
+        /,
+        *args,
+        cwd: Path,
+        env: Optional[Mapping[str, str]] = None,
+        timeout: Optional[float] = None,
+        on_output: Optional[Callable[[bytes], bool]] = None,
     ) -> tuple[int, str]:
-        logger.debug("%s: Running %s %s in %s", self.session_id, command, args, cwd)
-        proc = await asyncio.create_subprocess_exec(
-            command,
-            *args,
-            stdin=asyncio.subprocess.DEVNULL,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            cwd=cwd,
-        )
-        stdout, stderr = await proc.communicate()
-        logger.debug("%s: Done running %s %s", self.session_id, command, args)
-        logger.debug("%s: rc: %d", self.session_id, proc.returncode)
-        logger.debug("%s: stdout: %s", self.session_id, stdout)
-        logger.debug("%s: stderr: %s", self.session_id, stderr)
+        with tracer.span("process", self.session_id, cwd, args=args) as span:
+            proc = await asyncio.create_subprocess_exec(
+                command,
+                *args,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=cwd,
+                env=env,
+                start_new_session=True,
+            )
+            metrics.count("process.spawned")
+            try:
+                if on_output is None:
+                    stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+                    metrics.count("process.bytes_read", len(stdout))
+                else:
+                    stdout, stderr = await asyncio.wait_for(
+                        self._stream_output(proc, on_output), timeout
+                    )
+            except asyncio.TimeoutError:
+                await self._kill(proc)
+                span.set(timeout=timeout)
+                raise GitTimeout(f"{args} took more than {timeout:g}s") from None
+            except asyncio.CancelledError:
+                await self._kill(proc)
+                raise
+            span.set(rc=proc.returncode, stdout=stdout, stderr=stderr)
+        if on_output is not None:
+            # stdout has gone to on_output; stderr is what explains a failure.
+            return proc.returncode, stderr.decode(errors="replace")
         return proc.returncode, stdout.decode()
 
-    async def _run_git_command(self, /, *args, cwd: Path = None) -> tuple[int, str]:
-        if cwd is None:
-            cwd = self.repo_root
-        logger.debug("%s: Running git %s in %s", self.session_id, args, cwd)
+    async def _run_git_command(
+        self,
+        /,
+        *args,
+        repo: RepoPaths,
+        fetch: bool = False,
+        on_output: Optional[Callable[[bytes], bool]] = None,
+    ) -> tuple[int, str]:
+        cwd = repo.worktree
+        sessions = repo_hub.session_ids(cwd) | {self.session_id}
+        timeout = get_config_float("fetch_timeout" if fetch else "git_timeout")
+        async with git_scheduler.slot(cwd, sessions, fetch=fetch):
+            try:
+                return await self._run_git_command_now(
+                    *args, cwd=cwd, timeout=timeout or None, on_output=on_output
+                )
+            except GitTimeout as e:
+                metrics.count("git.timeouts")
+                timeouts = large_repo_policies.record_timeout(repo.git_dir, fetch)
+                logger.warning(
+                    "%s: %s in %s (%d timeouts there so far)",
+                    self.session_id,
+                    e,
+                    cwd,
+                    timeouts,
+                )
+                raise
+
+    async def _run_git_command_now(
+        self,
+        /,
+        *args,
+        cwd: Path,
+        timeout: Optional[float] = None,
+        on_output: Optional[Callable[[bytes], bool]] = None,
+    ) -> tuple[int, str]:
+        git, env = git_environment.resolve()
+        subcommand = next((a for a in args if not a.startswith("-")), "")
+        with metrics.timer(f"git.{subcommand}"):
+            return await self._run_command(
+                git, *args, cwd=cwd, env=env, timeout=timeout, on_output=on_output
+            )
+
+    async def _supports_porcelain_v2(self, repo: RepoPaths) -> bool:
         git_binary = get_config("git_binary")
-        logger.debug("%s: git binary is %s", self.session_id, git_binary)
-        if not Path(git_binary).is_file() and shutil.which(git_binary) is None:
-            raise FileNotFoundError(f"git binary {git_binary} not found")
-        cur_path = getenv("PATH", defpath)
-        logger.debug("%s: PATH is %s", self.session_id, cur_path)
+        if git_binary not in git_versions:
+            rc, stdout = await self._run_git_command("version", repo=repo)
+            git_versions[git_binary] = _parse_git_version(stdout) if rc == 0 else None
+            logger.debug(
+                "%s: git version is %s", self.session_id, git_versions[git_binary]
+            )
+        version = git_versions[git_binary]
+        return version is not None and version >= PORCELAIN_V2_MIN_VERSION
+
+    async def _scan_untracked(self, repo: RepoPaths, policy: RepoPolicy) -> None:
+        repo_root = repo.worktree
+        parser = UntrackedParser(cap=large_repo_policies.count_cap())
         try:
-            if Path(git_binary).is_absolute():
-                new_path = cur_path.split(pathsep)
-                new_path.append(str(Path(git_binary).parent))
-                environ["PATH"] = pathsep.join(new_path)
-            return await self._run_command(get_config("git_binary"), *args, cwd=cwd)
+            rc, stderr = await self._run_git_command(
+                "ls-files",
+                "--others",
+                "--exclude-standard",
+                "--directory",
+                "--no-empty-directory",
+                "-z",
+                repo=repo,
+                on_output=parser.feed,
+            )
+            if rc != 0 and not parser.capped:
+                logger.warning(
+                    "%s: untracked scan failed: %s", self.session_id, stderr.strip()
+                )
+                return
+            policy.untracked = parser.counts["untracked"]
+            policy.untracked_capped = parser.capped
+            await repo_hub.publish(
+                repo_root,
+                {"untracked": policy.untracked, "untracked_capped": parser.capped},
+            )
         finally:
-            environ["PATH"] = cur_path
+            policy.untracked_scanned_at = asyncio.get_event_loop().time()
+            policy.untracked_task = None
+
+    async def _collect_status(
+        self, repo: RepoPaths, porcelain_v2: bool
+    ) -> dict[str, any]:
+        loop = asyncio.get_event_loop()
+        large = await large_repo_policies.is_large(repo.git_dir)
+        untracked_mode = large_repo_policies.untracked_mode() if large else "scan"
+        parser = StatusParser(
+            porcelain_v2, cap=large_repo_policies.count_cap() if large else None
+        )
+        args = ["status", "-z"]
+        if porcelain_v2:
+            args += [
+                "--porcelain=v2",
+                "--branch",
+                "--show-stash",
+                "--no-ahead-behind",  # collect_counts memoizes these
+            ]
+        else:
+            args.append("--porcelain")
+        args += [
+            "--ignore-submodules",
+            "-unormal" if untracked_mode == "scan" else "-uno",
+        ]
+        start = loop.time()
+        rc, stderr = await self._run_git_command(
+            *args, repo=repo, on_output=parser.feed
+        )
+        if rc != 0 and not parser.capped:
+            raise RuntimeError(f"git status failed: {stderr.strip()}")
+        if not parser.capped:
+            large_repo_policies.record_scan(repo.git_dir, loop.time() - start)
+        res = {
+            "dirty": parser.dirty,
+            **parser.counts,
+            "tracked_capped": parser.capped,
+            "untracked_capped": parser.capped,
+        }
+        if untracked_mode != "scan":
+            policy = large_repo_policies.get(repo.git_dir)
+            res["untracked"] = None
+            res["untracked_capped"] = False
+            if untracked_mode == "defer":
+                res["untracked"] = policy.untracked
+                res["untracked_capped"] = policy.untracked_capped
+                res["dirty"] |= bool(policy.untracked)
+                if large_repo_policies.untracked_due(policy, loop.time()):
+                    policy.untracked_task = asyncio.create_task(
+                        self._scan_untracked(repo, policy)
+                    )
+        if porcelain_v2:
+            current_branch = parser.current_branch()
+            if current_branch is None:
+                raise RuntimeError("git status did not report a branch")
+            res["current_branch"] = current_branch
+            res["stashes"] = parser.stashes
+        return res
+
+    async def _collect_porcelain_v2(self, repo: RepoPaths) -> dict[str, any]:
+        return await self._collect_status(repo, porcelain_v2=True)
 
     @staticmethod
-    async def _read_first_line_int(f: PathLike | str) -> int:
+    def _read_first_line_int(f: PathLike | str) -> int:
         return int(Path(f).read_text(encoding="ascii").splitlines()[0].strip())
 
-    async def collect_repo_counts(self) -> dict[str, int]:
-        rc, stdout = await self._run_git_command(
-            "status", "--porcelain", "--ignore-submodules", "-unormal"
-        )
-        if rc != 0:
-            raise RuntimeError(f"git status failed: {stdout}")
-        dirty = False
-        untracked = 0
-        modified = 0
-        staged = 0
-        deleted = 0
-        for line in stdout.splitlines():
-            dirty = True
-            status = line[0:2]
-            if status == "??":
-                untracked += 1
-            elif status == "AM":
-                staged += 1
-                modified += 1
-            elif status == " M":
-                modified += 1
-            elif status == " D":
-                deleted += 1
-            elif status[0] == "A":
-                staged += 1
-            elif status[0] == "M":
-                staged += 1
-            elif status[0] == "D":
-                staged += 1
-        return {
-            "dirty": dirty,
-            "untracked": untracked,
-            "modified": modified,
-            "staged": staged,
-            "deleted": deleted,
-        }
+    async def collect_repo_counts(self, repo: RepoPaths) -> dict[str, any]:
+        return await self._collect_status(repo, porcelain_v2=False)
 
-    async def collect_current_branch(self) -> dict[str, str]:
-        rc, stdout = await self._run_git_command("branch", "--show-current")
+    async def collect_current_branch(self, repo: RepoPaths) -> dict[str, str]:
+        try:
+            head = await run_blocking(
+                metadata_reader.head, repo.git_dir, repo.common_dir
+            )
+        except (OSError, UnicodeDecodeError, UnsupportedRepository) as e:
+            logger.debug("%s: Can't read HEAD directly: %s", self.session_id, e)
+        else:
+            if head.branch is not None:
+                return {"current_branch": head.branch}
+            return {"current_branch": f"[{head.sha[:7]}]"}  # detached HEAD
+        rc, stdout = await self._run_git_command("branch", "--show-current", repo=repo)
         if rc == 0 and stdout != "":
             return {"current_branch": stdout.strip()}
-        rc, stdout = await self._run_git_command("rev-parse", "--short", "HEAD")
+        shas = await git_helpers.resolve(repo.worktree, "HEAD")
+        if shas is not None and shas[0] is not None:
+            return {"current_branch": f"[{shas[0][:7]}]"}  # detached HEAD
+        rc, stdout = await self._run_git_command(
+            "rev-parse", "--short", "HEAD", repo=repo
+        )
         if rc == 0:
             return {"current_branch": f"[{stdout.strip()}]"}  # detached HEAD
         raise RuntimeError(f"git branch failed: {stdout}")
 
-    async def collect_stashes(self) -> dict[str, int]:
-        rc, stdout = await self._run_git_command("stash", "list")
+    async def collect_stashes(self, repo: RepoPaths) -> dict[str, int]:
+        try:
+            return {
+                "stashes": await run_blocking(
+                    metadata_reader.stash_count, repo.git_dir, repo.common_dir
+                )
+            }
+        except (OSError, UnicodeDecodeError, UnsupportedRepository) as e:
+            logger.debug("%s: Can't count stashes directly: %s", self.session_id, e)
+        rc, stdout = await self._run_git_command("stash", "list", repo=repo)
         if rc != 0:
             raise RuntimeError(f"git stash failed: {stdout}")
         return {"stashes": len(stdout.splitlines())}
 
-    async def collect_counts(self) -> dict[str, int]:
+    @staticmethod
+    def _tracking_key(repo: RepoPaths) -> Optional[tuple]:
+        head = (repo.git_dir / "HEAD").read_text(encoding="ascii").strip()
+        if not head.startswith("ref: "):
+            return None
+        if head == "ref: refs/heads/.invalid":
+            # Reftable's placeholder, which stays put when the branch changes.
+            return ()
+        config = stat_cache.stat(repo.common_dir / "config")
+        return (
+            repo.common_dir,
+            head,
+            None if config is None else (config.st_mtime_ns, config.st_size),
+        )
+
+    async def _tracking_ref(self, repo: RepoPaths) -> Optional[str]:
+        try:
+            key = await run_blocking(self._tracking_key, repo)
+        except (OSError, UnicodeDecodeError):
+            key = ()
+        if key is None:
+            return None  # detached HEAD
+        if key in tracking_refs:
+            tracking_refs.move_to_end(key)
+            return tracking_refs[key]
         rc, stdout = await self._run_git_command(
-            "rev-list", "--left-right", "--count", "HEAD...@{u}"
+            "rev-parse", "--symbolic-full-name", "@{u}", repo=repo
         )
-        if rc == 0:
-            push_count, pull_count = map(int, stdout.split())
-        else:
+        tracking = stdout.strip()
+        if rc != 0 or not tracking.startswith("refs/"):
+            tracking = None
+        if key:
+            tracking_refs[key] = tracking
+            while len(tracking_refs) > TRACKING_REF_CACHE_SIZE:
+                tracking_refs.popitem(last=False)
+        return tracking
+
+    async def _branch_tips(self, repo: RepoPaths) -> Optional[tuple[str, str, str]]:
+        tracking = None
+        try:
+            head = await run_blocking(
+                metadata_reader.head, repo.git_dir, repo.common_dir
+            )
+            if head.branch is None or head.sha is None:
+                return None
+            upstream = await run_blocking(
+                metadata_reader.upstream, repo.git_dir, repo.common_dir, head.branch
+            )
+            if upstream is None:
+                return None
+            tracking, upstream_sha = upstream
+            if upstream_sha is not None:
+                return head.branch, head.sha, upstream_sha
+        except (OSError, UnicodeDecodeError, UnsupportedRepository) as e:
+            logger.debug("%s: Can't read branch tips directly: %s", self.session_id, e)
+        if tracking is None:
+            # The helper only gets full ref names: "@{u}" with no upstream
+            # makes cat-file exit rather than report it missing.
+            tracking = await self._tracking_ref(repo)
+            if tracking is None:
+                return None
+        shas = await git_helpers.resolve(repo.worktree, "HEAD", tracking)
+        if shas is not None:
+            return ("HEAD", *shas) if None not in shas else None
+        rc, stdout = await self._run_git_command(
+            "rev-parse", "HEAD", tracking, repo=repo
+        )
+        if rc != 0:
+            return None
+        head_sha, upstream_sha = stdout.split()
+        return "HEAD", head_sha, upstream_sha
+
+    async def collect_counts(self, repo: RepoPaths) -> dict[str, int]:
+        tips = await self._branch_tips(repo)
+        if tips is None:
+            return {"push_count": 0, "pull_count": 0}
+        branch, head, upstream = tips
+        if head == upstream:
             push_count, pull_count = 0, 0
+        else:
+            push_count, pull_count = await ahead_behind_cache.get(
+                partial(self._run_git_command, repo=repo),
+                repo.common_dir,
+                branch,
+                head,
+                upstream,
+            )
         return {"push_count": push_count, "pull_count": pull_count}
 
-    async def collect_repo_state(self) -> dict[str, int | str]:
-        git_dir = self.repo_root / ".git"
+    async def collect_repo_state(self, repo: RepoPaths) -> dict[str, int | str]:
+        # All of the probes go to the filesystem threads in one batch.
+        return await run_blocking(self._repo_state, repo.git_dir)
+
+    @classmethod
+    def _repo_state(cls, git_dir: Path) -> dict[str, int | str]:
         rebase_dir = git_dir / "rebase-merge"
         state = None
         step = None
         total = None
-        if rebase_dir.is_dir():
-            state = f"REBASE-{'i' if (rebase_dir / 'interactive').exists() else 'm'}"
-            step = await self._read_first_line_int(rebase_dir / "msgnum")
-            total = await self._read_first_line_int(rebase_dir / "end")
+        if stat_cache.is_dir(rebase_dir):
+            interactive = stat_cache.exists(rebase_dir / "interactive")
+            state = f"REBASE-{'i' if interactive else 'm'}"
+            step = cls._read_first_line_int(rebase_dir / "msgnum")
+            total = cls._read_first_line_int(rebase_dir / "end")
         else:
             rebase_dir = git_dir / "rebase-apply"
-            if rebase_dir.is_dir():
-                step = await self._read_first_line_int(rebase_dir / "next")
-                total = await self._read_first_line_int(rebase_dir / "last")
-                if (rebase_dir / "rebasing").exists():
+            if stat_cache.is_dir(rebase_dir):
+                step = cls._read_first_line_int(rebase_dir / "next")
+                total = cls._read_first_line_int(rebase_dir / "last")
+                if stat_cache.exists(rebase_dir / "rebasing"):
                     state = "REBASE"
-                elif (rebase_dir / "applying").exists():
+                elif stat_cache.exists(rebase_dir / "applying"):
                     state = "AM"
                 else:
                     state = "AM/REBASE"
-            elif (git_dir / "MERGE_HEAD").exists():
+            elif stat_cache.exists(git_dir / "MERGE_HEAD"):
                 state = "MERGING"
-            elif (git_dir / "CHERRY_PICK_HEAD").exists():
+            elif stat_cache.exists(git_dir / "CHERRY_PICK_HEAD"):
                 state = "CHERRY-PICKING"
-            elif (git_dir / "REVERT_HEAD").exists():
+            elif stat_cache.exists(git_dir / "REVERT_HEAD"):
                 state = "REVERTING"
-            elif (git_dir / "BISECT_LOG").exists():
+            elif stat_cache.exists(git_dir / "BISECT_LOG"):
                 state = "BISECTING"
         return {"state": state, "step": step, "total": total}
@@ -0,0 +1,141 @@
+import asyncio
+import itertools
+import os
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+from pathlib import Path
+from typing import AsyncIterator, Iterable, Optional
+
+from .config import get_config_float
+from .logger import logger
+from .metrics import metrics
+
+LICENSE = """
+Copyright 2023 Dj Padzensky
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software
+without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+
+class Priority(IntEnum):
+    FOCUSED = 0
+    BACKGROUND = 1
+    FETCH = 2
+
+
+@dataclass(eq=False)
+class _Job:
+    seq: int
+    repo_root: Optional[Path]
+    sessions: set[str]
+    fetch: bool
+    task: Optional[asyncio.Task] = None
+    granted: asyncio.Future = field(
+        default_factory=lambda: asyncio.get_event_loop().create_future()
+    )
+
+
+class GitScheduler:
+    def __init__(self):
+        self.focused_session_id: Optional[str] = None
+        self._seq = itertools.count()
+        self._waiting: list[_Job] = []
+        self._running: set[_Job] = set()
+
+    @property
+    def max_concurrency(self) -> int:
+        limit = int(get_config_float("max_git_processes"))
+        return limit if limit > 0 else os.cpu_count() or 4
+
+    def _priority(self, job: _Job) -> Priority:
+        if job.fetch:
+            return Priority.FETCH
+        if self.focused_session_id in job.sessions:
+            return Priority.FOCUSED
+        return Priority.BACKGROUND
+
+    def _can_run(self, job: _Job) -> bool:
+        # Fetches mostly wait on the network, so they only take slots that
+        # local work leaves free and never hold local work back.
+        running = [j for j in self._running if job.fetch or not j.fetch]
+        return len(running) < self.max_concurrency
+
+    def _grant(self) -> None:
+        while ready := [j for j in self._waiting if self._can_run(j)]:
+            # The focused session can change while jobs are queued, so pick the
+            # next job at grant time rather than keeping a heap.
+            job = min(ready, key=lambda j: (self._priority(j), j.seq))
+            self._waiting.remove(job)
+            self._running.add(job)
+            job.granted.set_result(None)
+
+    def set_focused(self, session_id: Optional[str]) -> None:
+        logger.debug("Focused session is now %s", session_id)
+        self.focused_session_id = session_id
+
+    @asynccontextmanager
+    async def slot(
+        self, repo_root: Optional[Path], sessions: Iterable[str], fetch: bool = False
+    ) -> AsyncIterator[None]:
+        job = _Job(
+            seq=next(self._seq),
+            repo_root=repo_root,
+            sessions=set(sessions),
+            fetch=fetch,
+        )
+        job.task = asyncio.current_task()
+        self._waiting.append(job)
+        self._grant()
+        try:
+            with metrics.timer("git_scheduler.queue_wait"):
+                await job.granted
+        except asyncio.CancelledError:
+            if job in self._waiting:
+                self._waiting.remove(job)
+            else:
+                self._running.discard(job)
+                self._grant()
+            raise
+        try:
+            yield
+        finally:
+            self._running.discard(job)
+            self._grant()
+
+    def cancel_stale(self, session_id: str, repo_root: Optional[Path]) -> None:
+        for job in [*self._waiting, *self._running]:
+            if session_id not in job.sessions or job.repo_root == repo_root:
+                continue
+            job.sessions.discard(session_id)
+            if not job.sessions and job.task is not None:
+                logger.debug("Cancelling git work in %s", job.repo_root)
+                job.task.cancel()
+
+
+git_scheduler = GitScheduler()
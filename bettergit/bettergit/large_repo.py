@@ -0,0 +1,117 @@
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from .config import get_config, get_config_float
+from .logger import logger
+from .stat_cache import run_blocking, stat_cache
+
+LICENSE = """
+Copyright 2023 Dj Padzensky
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software
+without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+UNTRACKED_INTERVAL = 120.0
+MAX_POLICIES = 256
+
+
+@dataclass
+class RepoPolicy:
+    slow_scan: bool = False
+    untracked: Optional[int] = None
+    untracked_capped: bool = False
+    untracked_scanned_at: float = 0.0
+    untracked_task: Optional[asyncio.Task] = None
+    timeouts: int = 0
+
+
+class LargeRepoPolicies:
+    def __init__(self):
+        self._policies: OrderedDict[Path, RepoPolicy] = OrderedDict()
+
+    def get(self, git_dir: Path) -> RepoPolicy:
+        policy = self._policies.get(git_dir)
+        if policy is None:
+            policy = self._policies[git_dir] = RepoPolicy()
+            while len(self._policies) > MAX_POLICIES:
+                self._policies.popitem(last=False)
+        self._policies.move_to_end(git_dir)
+        return policy
+
+    async def is_large(self, git_dir: Path) -> bool:
+        if self.get(git_dir).slow_scan:
+            return True
+        return await run_blocking(self._large_index, git_dir)
+
+    @staticmethod
+    def _large_index(git_dir: Path) -> bool:
+        st = stat_cache.stat(git_dir / "index")
+        if st is None:
+            return False
+        return st.st_size >= get_config_float("large_repo_index_mb") * 1024 * 1024
+
+    def record_scan(self, git_dir: Path, seconds: float) -> None:
+        policy = self.get(git_dir)
+        if not policy.slow_scan and seconds >= get_config_float(
+            "large_repo_scan_seconds"
+        ):
+            logger.info(
+                "%s took %.1fs to scan; using large repo mode", git_dir, seconds
+            )
+            policy.slow_scan = True
+
+    def record_timeout(self, git_dir: Path, fetch: bool) -> int:
+        policy = self.get(git_dir)
+        policy.timeouts += 1
+        # A slow fetch says more about the network than about the repository.
+        if not fetch and not policy.slow_scan:
+            logger.info("git timed out in %s; using large repo mode", git_dir)
+            policy.slow_scan = True
+        return policy.timeouts
+
+    @staticmethod
+    def count_cap() -> int:
+        return max(int(get_config_float("large_repo_count_cap")), 1)
+
+    @staticmethod
+    def untracked_mode() -> str:
+        mode = str(get_config("large_repo_untracked")).strip().lower()
+        return mode if mode in ("scan", "defer", "skip") else "defer"
+
+    @staticmethod
+    def untracked_due(policy: RepoPolicy, now: float) -> bool:
+        return (
+            policy.untracked_task is None
+            and policy.untracked_scanned_at + UNTRACKED_INTERVAL <= now
+        )
+
+
+large_repo_policies = LargeRepoPolicies()
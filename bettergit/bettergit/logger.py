@@ -45,4 +45,4 @@ def set_debug(debug: bool):
         logger.info("Set log level to %s", new_level)
 
 
-logger = logging.getLogger()
+logger = logging.getLogger("bettergit")
@@ -1,9 +1,16 @@
+import asyncio
+import signal
+
 from iterm2 import Connection, EachSessionOnceMonitor, async_get_app
 
 from .app_globals import app_globals
+from .focus_monitor import focus_monitor
 from .logger import logger
+from .metrics import metrics
 from .prompt_monitor import prompt_monitor
 from .sb_component import sb_component, sb_component_callback
+from .tracing import tracer
+from .warmup import warm_up
 
 
 async def main(connection: Connection):
@@ -13,8 +20,14 @@ async def main(connection: Connection):
     logger.info("BetterGit started")
     logger.info("connection is %s", connection)
     logger.info("app is %s", app_globals.app)
+    asyncio.get_event_loop().add_signal_handler(signal.SIGUSR1, tracer.dump)
     logger.info("Registering status bar component")
     await sb_component.async_register(app_globals.connection, sb_component_callback)
+    logger.info("Registering focus monitor")
+    app_globals.focus_task = asyncio.create_task(focus_monitor())
+    if app_globals.metrics_task is None:
+        app_globals.metrics_task = asyncio.create_task(metrics.dump_periodically())
+    warm_up.start(app_globals.app)
     logger.info("Registering prompt monitor")
     await EachSessionOnceMonitor.async_foreach_session_create_task(
         app_globals.app, prompt_monitor
@@ -0,0 +1,186 @@
+import asyncio
+import bisect
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from .config import get_config
+from .logger import logger
+
+LICENSE = """
+Copyright 2023 Dj Padzensky
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software
+without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+# Upper bounds of the latency buckets, in milliseconds.
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+DUMP_INTERVAL = 30.0
+# How often the loop lag monitor wakes up, and how late it has to be before
+# it's worth a log line.
+LAG_INTERVAL = 0.25
+LAG_LOG_THRESHOLD = 0.1
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        ms = seconds * 1000
+        self.buckets[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p: float) -> float:
+        # Reported as the upper bound of the bucket the percentile falls in.
+        rank = p * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS_MS, self.buckets):
+            seen += n
+            if seen >= rank:
+                return round(min(bound, self.max), 3)
+        return round(self.max, 3)
+
+    def snapshot(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p90_ms": self.percentile(0.9),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max, 3),
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self.counters: defaultdict[str, int] = defaultdict(int)
+        self.histograms: defaultdict[str, Histogram] = defaultdict(Histogram)
+        self.started = time.time()
+        self._lag_task: Optional[asyncio.Task] = None
+        # Counts and timings also come from the filesystem threads.
+        self._lock = threading.Lock()
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.histograms[name].observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def group(self, prefix: str) -> dict[str, int]:
+        with self._lock:
+            return {
+                k[len(prefix) :]: v
+                for k, v in self.counters.items()
+                if k.startswith(prefix)
+            }
+
+    def snapshot(self) -> dict[str, any]:
+        with self._lock:
+            return {
+                "uptime": round(time.time() - self.started, 1),
+                "counters": dict(sorted(self.counters.items())),
+                "histograms": {
+                    k: h.snapshot() for k, h in sorted(self.histograms.items())
+                },
+            }
+
+    def summary(self) -> str:
+        collect = self.histograms.get("collect")
+        hub = self.group("repo_hub.")
+        lookups = hub.get("hits", 0) + hub.get("misses", 0)
+        parts = [f"{self.counters['process.spawned']} procs"]
+        if collect is not None and collect.count:
+            parts.append(f"collect p90 {collect.percentile(0.9):.0f}ms")
+        if lookups:
+            parts.append(f"hub {100 * hub.get('hits', 0) // lookups}%")
+        parts.append(f"{self.counters['push.sent']} pushes")
+        lag = self.histograms.get("loop.lag")
+        if lag is not None and lag.count:
+            parts.append(f"lag p99 {lag.percentile(0.99):.0f}ms")
+        return ", ".join(parts)
+
+    @staticmethod
+    def _write(path: Path, data: str) -> None:
+        path = path.expanduser()
+        tmp = path.with_name(f".{path.name}.tmp")
+        tmp.write_text(data, encoding="utf-8")
+        os.replace(tmp, path)
+
+    async def dump_periodically(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(DUMP_INTERVAL)
+            path = get_config("metrics_file")
+            if not path:
+                continue
+            data = json.dumps(self.snapshot(), indent=1)
+            try:
+                await loop.run_in_executor(None, self._write, Path(path), data)
+            except OSError as e:
+                logger.warning("Couldn't write metrics to %s: %s", path, e)
+
+    async def _monitor_loop_lag(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            expected = loop.time() + LAG_INTERVAL
+            await asyncio.sleep(LAG_INTERVAL)
+            lag = max(loop.time() - expected, 0.0)
+            self.observe("loop.lag", lag)
+            if lag >= LAG_LOG_THRESHOLD:
+                logger.debug("Event loop was blocked for %.0fms", lag * 1000)
+
+    def set_lag_monitor(self, enabled: bool) -> None:
+        if enabled and self._lag_task is None:
+            self._lag_task = asyncio.create_task(self._monitor_loop_lag())
+        elif not enabled and self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+
+
+metrics = Metrics()
@@ -1,60 +1,154 @@
 import asyncio
 import json
+from typing import Optional
 
 from iterm2 import PromptMonitor, async_get_last_prompt
 
 from .app_globals import app_globals
+from .config import get_config_float
 from .git_poller import GitPoller
 from .logger import logger
+from .metrics import metrics
 from .repo_status import RepoStatus
-from .utils import find_git_root
+from .stat_cache import run_blocking
+from .update_dispatcher import UpdateDispatcher
+from .utils import repo_resolver
+from .visibility import visibility
 
+TRIGGER_VAR = "user.python_bettergit_trigger"
 
-async def _session_trigger(repo_status: RepoStatus):
-    logger.debug("Triggering session %s", repo_status.session_id)
-    session_id = repo_status.session_id
+
+async def _set_trigger(session_id: str, trigger_value: str) -> None:
     session = app_globals.app.get_session_by_id(session_id)
     if not session:
         return
-    trigger_value = json.dumps(repo_status.render())
     logger.debug("%s: Triggering sb update with %s", session_id, trigger_value)
-    await session.async_set_variable("user.python_bettergit_trigger", trigger_value)
+    await session.async_set_variable(TRIGGER_VAR, trigger_value)
     logger.debug("%s: Triggered", session_id)
 
 
-async def _poll(poller: GitPoller) -> bool:
-    session_id = poller.session_id
+update_dispatcher = UpdateDispatcher(_set_trigger)
+
+
+async def _session_trigger(repo_status: RepoStatus):
+    logger.debug("Triggering session %s", repo_status.session_id)
+    update_dispatcher.submit(repo_status.session_id, json.dumps(repo_status.render()))
+
+
+async def _get_cwd(session_id: str) -> Optional[str]:
     prompt = await async_get_last_prompt(app_globals.connection, session_id)
     logger.debug("%s: prompt is %s", session_id, prompt)
     if prompt is None:
-        return
-    cwd = prompt.working_directory
+        return None
+    return prompt.working_directory
+
+
+async def _poll(poller: GitPoller) -> bool:
+    session_id = poller.session_id
+    cwd = await _get_cwd(session_id)
     logger.debug("%s: cwd is %s", session_id, cwd)
     if cwd is None:
         return
     logger.debug("%s: Finding git root (was %s)", session_id, poller.repo_root)
-    poller.repo_root = find_git_root(cwd)
+    poller.repo = await run_blocking(repo_resolver.resolve, cwd)
     logger.debug("%s: Git root at %s", session_id, poller.repo_root)
     if poller.repo_root is None:
         logger.debug("%s: No git root found", session_id)
-        session = app_globals.app.get_session_by_id(session_id)
-        await session.async_set_variable("user.python_bettergit_trigger", "[]")
+        update_dispatcher.submit(session_id, "[]")
         return
     await poller.collect()
     logger.debug("%s: Poller state: %s", session_id, poller)
 
 
+class _PromptDebouncer:
+    def __init__(self, poller: GitPoller):
+        self.poller = poller
+        self._pending = False
+        self._worker: Optional[asyncio.Task] = None
+        self._poll_task: Optional[asyncio.Task] = None
+        self._superseded = False
+        self._checks: set[asyncio.Task] = set()
+
+    def prompted(self) -> None:
+        metrics.count("debounce.prompts")
+        if self._pending:
+            # This prompt didn't need a collection of its own.
+            metrics.count("debounce.saved")
+        self._schedule()
+
+    def revalidate(self) -> None:
+        # The session came into view; bring it up to date without waiting for
+        # a prompt.
+        metrics.count("visibility.revalidations")
+        if self.poller.repo_root is not None:
+            self._schedule()
+
+    def _schedule(self) -> None:
+        self._pending = True
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        elif self._poll_task is not None and not self._poll_task.done():
+            check = asyncio.create_task(self._check_superseded(self._poll_task))
+            self._checks.add(check)
+            check.add_done_callback(self._checks.discard)
+
+    async def _check_superseded(self, poll_task: asyncio.Task) -> None:
+        cwd = await _get_cwd(self.poller.session_id)
+        if cwd is None or poll_task.done():
+            return
+        repo = await run_blocking(repo_resolver.resolve, cwd)
+        if poll_task.done():
+            return
+        if repo != self.poller.repo:
+            logger.debug("%s: cwd moved to %s", self.poller.session_id, cwd)
+            metrics.count("debounce.superseded")
+            self._superseded = True
+            poll_task.cancel()
+
+    async def _run(self) -> None:
+        while self._pending:
+            await asyncio.sleep(get_config_float("prompt_debounce_ms") / 1000)
+            self._pending = False
+            metrics.count("debounce.collections")
+            self._superseded = False
+            self._poll_task = asyncio.create_task(_poll(self.poller))
+            try:
+                await self._poll_task
+            except asyncio.CancelledError:
+                if not self._superseded:
+                    raise
+            except Exception:
+                logger.exception("%s: Polling failed", self.poller.session_id)
+            logger.debug(
+                "%s: debounce stats: %s",
+                self.poller.session_id,
+                metrics.group("debounce."),
+            )
+
+    def close(self) -> None:
+        for task in (self._worker, self._poll_task, *self._checks):
+            if task is not None:
+                task.cancel()
+
+
 async def prompt_monitor(session_id: str):
     logger.debug("Starting prompt monitor for session %s", session_id)
     session = app_globals.app.get_session_by_id(session_id)
     poller = GitPoller(session_id=str(session_id), update_trigger=_session_trigger)
     if not session:
         return
+    debouncer = _PromptDebouncer(poller)
+    visibility.watch(poller.session_id, debouncer.revalidate)
     try:
         async with PromptMonitor(app_globals.connection, session_id) as mon:
-            await _poll(poller)
+            debouncer.prompted()
             while True:
                 await mon.async_get()
-                await _poll(poller)
+                debouncer.prompted()
     except asyncio.CancelledError:
         logger.debug("Ending session %s", session_id)
+    finally:
+        visibility.unwatch(poller.session_id)
+        debouncer.close()
+        poller.repo_root = None
+        update_dispatcher.forget(session_id)
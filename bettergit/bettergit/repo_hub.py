@@ -0,0 +1,227 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+from weakref import WeakSet
+
+from .fingerprint import Fingerprint, repo_fingerprint
+from .logger import logger
+from .metrics import metrics
+from .snapshot import snapshot_store
+from .stat_cache import run_blocking
+from .utils import RepoPaths
+
+if TYPE_CHECKING:
+    from .git_poller import GitPoller
+
+LICENSE = """
+Copyright 2023 Dj Padzensky
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software
+without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+# How long a finished collection is handed out to other sessions in the same
+# repository before a new one is run.
+CACHE_TTL = 1.0
+# Cached results whose fingerprint still matches are reused for at most this
+# long, since edits to tracked files deep in the worktree don't show up in it.
+FINGERPRINT_MAX_AGE = 30.0
+
+
+@dataclass
+class _RepoEntry:
+    subscribers: WeakSet = field(default_factory=WeakSet)
+    values: Optional[dict[str, any]] = None
+    collected_at: float = 0.0
+    fingerprint: Optional[Fingerprint] = None
+    in_flight: Optional[asyncio.Task] = None
+
+
+class RepoHub:
+    def __init__(
+        self, ttl: float = CACHE_TTL, fingerprint_max_age: float = FINGERPRINT_MAX_AGE
+    ):
+        self.ttl = ttl
+        self.fingerprint_max_age = fingerprint_max_age
+        self._repos: dict[Path, _RepoEntry] = {}
+
+    def _entry(self, repo_root: Path) -> _RepoEntry:
+        entry = self._repos.get(repo_root)
+        if entry is None:
+            entry = self._repos[repo_root] = _RepoEntry()
+            saved = snapshot_store.repo(repo_root)
+            if saved is not None:
+                # Carried over from a previous run; treated like any other
+                # result of that age when deciding whether to recollect.
+                entry.values, entry.fingerprint, saved_at = saved
+                age = max(time.time() - saved_at, 0.0)
+                entry.collected_at = asyncio.get_event_loop().time() - age
+        return entry
+
+    def subscribe(self, poller: "GitPoller", repo_root: Path) -> None:
+        self._entry(repo_root).subscribers.add(poller)
+
+    def peek(self, repo_root: Path) -> Optional[dict[str, any]]:
+        return self._entry(repo_root).values
+
+    def unsubscribe(self, poller: "GitPoller", repo_root: Path) -> None:
+        entry = self._repos.get(repo_root)
+        if entry is None:
+            return
+        entry.subscribers.discard(poller)
+        if not entry.subscribers and entry.in_flight is None:
+            del self._repos[repo_root]
+
+    def session_ids(self, repo_root: Optional[Path]) -> set[str]:
+        entry = self._repos.get(repo_root)
+        if entry is None:
+            return set()
+        return {p.session_id for p in entry.subscribers}
+
+    def invalidate(self, repo_root: Path) -> None:
+        entry = self._repos.get(repo_root)
+        if entry is not None:
+            entry.values = None
+            entry.fingerprint = None
+
+    def _cached(self, entry: _RepoEntry, fingerprint: Fingerprint) -> bool:
+        if entry.values is None:
+            return False
+        age = asyncio.get_event_loop().time() - entry.collected_at
+        if age < self.ttl:
+            return True
+        return entry.fingerprint == fingerprint and age < self.fingerprint_max_age
+
+    async def collect(
+        self,
+        poller: "GitPoller",
+        repo: RepoPaths,
+        force: bool = False,
+        start: bool = True,
+    ) -> Optional[dict]:
+        repo_root = repo.worktree
+        while poller.repo_root == repo_root:
+            self.subscribe(poller, repo_root)
+            entry = self._repos[repo_root]
+            if entry.in_flight is None:
+                fingerprint = await run_blocking(
+                    repo_fingerprint, repo_root, repo.git_dir, repo.common_dir
+                )
+            # Someone else may have started a collection while we were looking.
+            if entry.in_flight is None:
+                if not force and self._cached(entry, fingerprint):
+                    logger.debug("%s: Using cached status", poller.session_id)
+                    metrics.count("repo_hub.hits")
+                    return entry.values
+                if not start:
+                    return None
+                metrics.count("repo_hub.misses")
+                entry.in_flight = asyncio.create_task(
+                    self._run(poller, repo, entry, fingerprint)
+                )
+            else:
+                logger.debug("%s: Joining collection in flight", poller.session_id)
+            # Shielded so that one session going away doesn't cancel the
+            # collection for everyone else waiting on it.
+            in_flight = entry.in_flight
+            try:
+                values = await asyncio.shield(in_flight)
+            except asyncio.CancelledError:
+                if not in_flight.cancelled():
+                    raise
+                # Cancelled for the sessions whose commands it was running;
+                # anyone still here starts over.
+                continue
+            if values is not None:
+                return values
+            # The session that started it moved on; start over if we haven't.
+        return None
+
+    async def publish(self, repo_root: Path, values: dict[str, any]) -> None:
+        entry = self._repos.get(repo_root)
+        if entry is None:
+            return
+        if entry.values is not None:
+            entry.values = {**entry.values, **values}
+            snapshot_store.record_repo(repo_root, entry.values, entry.fingerprint)
+        await asyncio.gather(
+            *[
+                p.update_repo_status(values)
+                for p in list(entry.subscribers)
+                if p.repo_root == repo_root
+            ]
+        )
+
+    async def _run(
+        self,
+        poller: "GitPoller",
+        repo: RepoPaths,
+        entry: _RepoEntry,
+        fingerprint: Fingerprint,
+    ) -> Optional[dict]:
+        repo_root = repo.worktree
+
+        async def publish_fast(fast: dict[str, any]) -> None:
+            # Shown to everyone as soon as it's in, with the rest marked stale
+            # until the slow tier catches up.
+            await asyncio.gather(
+                *[
+                    p.update_repo_status({**fast, "stale": True})
+                    for p in list(entry.subscribers)
+                    if p.repo_root == repo_root
+                ]
+            )
+
+        try:
+            with metrics.timer("collect"):
+                values = await poller.run_collectors(repo, on_fast=publish_fast)
+        finally:
+            entry.in_flight = None
+        if poller.repo_root != repo_root:
+            # The session moved elsewhere while collecting. Nothing of this run
+            # is handed out; whoever joined it runs their own.
+            metrics.count("repo_hub.abandoned")
+            return None
+        entry.values = values
+        entry.fingerprint = fingerprint
+        entry.collected_at = asyncio.get_event_loop().time()
+        snapshot_store.record_repo(repo_root, values, fingerprint)
+        await asyncio.gather(
+            *[
+                p.update_repo_status({**values, "stale": False})
+                for p in list(entry.subscribers)
+                if p is not poller and p.repo_root == repo_root
+            ]
+        )
+        if not entry.subscribers:
+            self._repos.pop(repo_root, None)
+        return values
+
+
+repo_hub = RepoHub()
@@ -1,10 +1,13 @@
 import json
-from dataclasses import asdict, dataclass
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, fields
 from pathlib import Path
 from typing import Optional
 
-from .config import get_config
+from .config import get_config, get_config_version
 from .logger import logger
+from .metrics import metrics
+from .tracing import tracer
 
 LICENSE = """
 Copyright 2023 Dj Padzensky
@@ -37,11 +40,17 @@ ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
 THE POSSIBILITY OF SUCH DAMAGE.
 """
 
+RENDER_CACHE_SIZE = 256
+
+_render_cache: OrderedDict[tuple, str | list[str]] = OrderedDict()
+
 
 @dataclass(frozen=False, kw_only=True)
 class RepoStatus:
     session_id: str
     fetching: bool = False
+    # Set while the working tree counts and ahead/behind are being refreshed.
+    stale: bool = False
     repo_root: Optional[Path] = None
     push_count: Optional[int] = None
     pull_count: Optional[int] = None
@@ -52,12 +61,39 @@ class RepoStatus:
     staged: Optional[int] = None
     deleted: Optional[int] = None
     stashes: Optional[int] = None
+    tracked_capped: bool = False
+    untracked_capped: bool = False
     state: Optional[str] = None
     step: Optional[int] = None
     total: Optional[int] = None
 
+    def _count(self, count: int, untracked: bool = False) -> str:
+        capped = self.untracked_capped if untracked else self.tracked_capped
+        return f"{count}+" if capped else str(count)
+
+    def _render_key(self) -> tuple:
+        return (get_config_version(),) + tuple(
+            getattr(self, f.name) for f in fields(self) if f.name != "session_id"
+        )
+
     def render(self) -> str | list[str]:
-        logger.debug("%s: rendering %s", self.session_id, self)
+        key = self._render_key()
+        rendered = _render_cache.get(key)
+        if rendered is not None:
+            metrics.count("render.hits")
+            _render_cache.move_to_end(key)
+            return rendered
+        metrics.count("render.misses")
+        with metrics.timer("render"), tracer.span(
+            "render", self.session_id, self.repo_root
+        ):
+            rendered = self._render()
+        _render_cache[key] = rendered
+        while len(_render_cache) > RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+        return rendered
+
+    def _render(self) -> str | list[str]:
         if self.repo_root is None:
             return ""
         if self.state:
@@ -66,10 +102,10 @@ class RepoStatus:
                 status_line += f" ({self.step}/{self.total})"
             return status_line
         parts: list[str] = []
-        logger.debug("%s: 1", self.session_id)
-        part = get_config("icon_status_fetching") if self.fetching else ""
+        part = get_config("icon_fetching") if self.fetching else ""
+        if self.stale:
+            part += get_config("icon_stale")
         parts.append(part)
-        logger.debug("%s: 2", self.session_id)
         part = ""
         if self.dirty:
             part += get_config("icon_status_dirty")
@@ -78,39 +114,31 @@ class RepoStatus:
         else:
             part += get_config("icon_status_clean")
         part += f" {self.current_branch}"
-        logger.debug("%s: 2a", self.session_id)
-        logger.debug("%s: 2a: %s %s", self.session_id, self.push_count, self.pull_count)
         if self.push_count and self.push_count > 0:
             part += " " + get_config("icon_push_count") + f" {self.push_count}"
-        logger.debug("%s: 2b", self.session_id)
         if self.pull_count and self.pull_count > 0:
             part += " " + get_config("icon_pull_count") + f" {self.pull_count}"
-        logger.debug("%s: 2c", self.session_id)
         parts.append(part.strip())
-        logger.debug("%s: 3", self.session_id)
         part = ""
         if self.modified and self.modified > 0:
-            part += " " + get_config("icon_modified_count") + f" {self.modified}"
+            part += f" {get_config('icon_modified_count')} {self._count(self.modified)}"
         if self.untracked:
-            part += " " + get_config("icon_untracked_count") + f" {self.untracked}"
+            untracked = self._count(self.untracked, untracked=True)
+            part += f" {get_config('icon_untracked_count')} {untracked}"
         if self.deleted:
-            part += " " + get_config("icon_deleted_count") + f" {self.deleted}"
+            part += f" {get_config('icon_deleted_count')} {self._count(self.deleted)}"
         parts.append(part.strip())
-        logger.debug("%s: 4", self.session_id)
         part = ""
         if self.staged:
-            part += " " + get_config("icon_staged_count") + f" {self.staged}"
+            part += f" {get_config('icon_staged_count')} {self._count(self.staged)}"
         if self.stashes:
             part += " " + get_config("icon_stashes_count") + f" {self.stashes}"
         parts.append(part.strip())
-        logger.debug("%s: 5a: %s", self.session_id, parts)
         parts = [part for part in parts if part != ""]
-        logger.debug("%s: 5b: %s", self.session_id, parts)
         ret = [
             " \N{LEFT VERTICAL BOX LINE} ".join(parts[0:x])
             for x in range(1, len(parts) + 1)
         ]
-        logger.debug("%s: 6: %s", self.session_id, ret)
         return ret
 
     def to_json(self) -> str:
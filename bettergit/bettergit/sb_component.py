@@ -4,10 +4,12 @@ from iterm2 import Reference, StatusBarRPC
 from iterm2.statusbar import CheckboxKnob, Knob, StatusBarComponent, StringKnob
 
 from .app_globals import APP_ID
-from .config import STRING_KNOB_CONFIGS, get_config_default, set_config
+from .config import STRING_KNOB_CONFIGS, get_config, get_config_default, set_config
 from .logger import logger
 from .logger import set_debug as logger_set_debug
+from .metrics import metrics
 from .repo_status import RepoStatus
+from .tracing import tracer
 
 sb_component = StatusBarComponent(
     short_description="Python BetterGit",
@@ -17,6 +19,20 @@ sb_component = StatusBarComponent(
     identifier=APP_ID,
     knobs=[
         CheckboxKnob("Debug", False, "debug"),
+        CheckboxKnob("Trace (dump with SIGUSR1)", get_config_default("trace"), "trace"),
+        CheckboxKnob(
+            "Persistent git helpers",
+            get_config_default("persistent_git_helpers"),
+            "persistent_git_helpers",
+        ),
+        CheckboxKnob(
+            "Show metrics", get_config_default("show_metrics"), "show_metrics"
+        ),
+        CheckboxKnob(
+            "Pause background tabs",
+            get_config_default("pause_hidden_sessions"),
+            "pause_hidden_sessions",
+        ),
         *[
             StringKnob(k.name, k.placeholder or "", get_config_default(k.key), k.key)
             for k in STRING_KNOB_CONFIGS
@@ -34,11 +50,18 @@ async def sb_component_callback(
     logger.debug("%s: SB Wake up!", str(session_id))
     if "debug" in knobs:
         logger_set_debug(knobs["debug"] == 1)
+        metrics.set_lag_monitor(knobs["debug"] == 1)
+    if "trace" in knobs:
+        tracer.set_enabled(knobs["trace"] == 1)
     for k, v in knobs.items() or {}:
         set_config(k, v)
     logger.debug("%s: got %s", session_id, trigger)
     if not trigger or not str(trigger).startswith("["):
         return ""
     trigger_val = json.loads(str(trigger))
+    if get_config("show_metrics") == 1:
+        variants = trigger_val if isinstance(trigger_val, list) else [trigger_val]
+        summary = metrics.summary()
+        trigger_val = [f"{v} [{summary}]" for v in variants] + variants
     logger.debug("%s: returning %s", session_id, trigger_val)
     return trigger_val
@@ -0,0 +1,169 @@
+import asyncio
+import atexit
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from .logger import logger
+
+LICENSE = """
+Copyright 2023 Dj Padzensky
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software
+without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+SNAPSHOT_FILE = Path.home() / "Library" / "Caches" / "bettergit" / "snapshot.json"
+SNAPSHOT_VERSION = 2
+# Writes are coalesced so that at most one happens per this many seconds.
+SAVE_INTERVAL = 15.0
+MAX_REPOS = 200
+MAX_FETCH_TARGETS = 256
+# Status fields that only make sense for a live session.
+TRANSIENT_FIELDS = ("session_id", "fetching", "stale", "repo_root")
+
+
+def _tuples(value):
+    # JSON turns the fingerprint's tuples into lists; turn them back.
+    if isinstance(value, list):
+        return tuple(_tuples(v) for v in value)
+    return value
+
+
+class SnapshotStore:
+    def __init__(self, path: Path = SNAPSHOT_FILE):
+        self.path = path
+        self._repos: Optional[dict[str, dict]] = None
+        self._fetch: dict[str, dict] = {}
+        self._save_task: Optional[asyncio.Task] = None
+
+    def _load(self) -> None:
+        if self._repos is not None:
+            return
+        self._repos = {}
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable snapshot %s: %s", self.path, e)
+            return
+        if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+            return
+        self._repos = data.get("repos", {})
+        self._fetch = data.get("fetch", {})
+        logger.info("Loaded status for %d repositories", len(self._repos))
+
+    def repo(self, repo_root: Path) -> Optional[tuple[dict, tuple, float]]:
+        self._load()
+        saved = self._repos.get(str(repo_root))
+        if saved is None:
+            return None
+        return saved["status"], _tuples(saved["fingerprint"]), saved["saved_at"]
+
+    def record_repo(
+        self, repo_root: Path, values: dict[str, any], fingerprint: Optional[tuple]
+    ) -> None:
+        self._load()
+        self._repos[str(repo_root)] = {
+            "status": {k: v for k, v in values.items() if k not in TRANSIENT_FIELDS},
+            "fingerprint": fingerprint,
+            "saved_at": time.time(),
+        }
+        self._schedule_save()
+
+    @staticmethod
+    def _fetch_key(common_dir: Path, remote: str) -> str:
+        return f"{common_dir}\t{remote}"
+
+    def fetch_state(self, common_dir: Path, remote: str) -> Optional[dict]:
+        self._load()
+        return self._fetch.get(self._fetch_key(common_dir, remote))
+
+    def record_fetch(self, common_dir: Path, remote: str, state: dict) -> None:
+        self._load()
+        self._fetch[self._fetch_key(common_dir, remote)] = {
+            **state,
+            "saved_at": time.time(),
+        }
+        self._schedule_save()
+
+    def _schedule_save(self) -> None:
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.create_task(self._save_later())
+
+    @staticmethod
+    def _newest(entries: dict[str, dict], limit: int) -> dict[str, dict]:
+        if len(entries) <= limit:
+            return entries
+        newest = sorted(entries.items(), key=lambda kv: kv[1]["saved_at"])[-limit:]
+        return dict(newest)
+
+    async def _save_later(self) -> None:
+        await asyncio.sleep(SAVE_INTERVAL)
+        self._repos = self._newest(self._repos, MAX_REPOS)
+        self._fetch = self._newest(self._fetch, MAX_FETCH_TARGETS)
+        data = json.dumps(
+            {"version": SNAPSHOT_VERSION, "repos": self._repos, "fetch": self._fetch},
+            separators=(",", ":"),
+        )
+        await asyncio.get_event_loop().run_in_executor(None, self._write, data)
+
+    def _write(self, data: str) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=".snapshot-")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp, self.path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError as e:
+            logger.warning("Couldn't save snapshot %s: %s", self.path, e)
+
+    def flush(self) -> None:
+        if self._repos is not None:
+            self._write(
+                json.dumps(
+                    {
+                        "version": SNAPSHOT_VERSION,
+                        "repos": self._newest(self._repos, MAX_REPOS),
+                        "fetch": self._newest(self._fetch, MAX_FETCH_TARGETS),
+                    },
+                    separators=(",", ":"),
+                )
+            )
+
+
+snapshot_store = SnapshotStore()
+# Catch whatever changed since the last delayed save.
+atexit.register(snapshot_store.flush)
@@ -0,0 +1,103 @@
+import asyncio
+import os
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from os import PathLike
+from time import monotonic
+from typing import Callable, Optional, TypeVar
+
+from .metrics import metrics
+
+LICENSE = """
+Copyright 2023 Dj Padzensky
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software
+without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+# How long a stat result is shared before the file is looked at again. This is
+# well under RepoHub's own reuse window, so it can't hide a change for longer
+# than that already does.
+STAT_TTL = 0.5
+STAT_CACHE_SIZE = 4096
+# Filesystem work runs on its own threads, so that a hung network mount can't
+# tie up the default executor as well.
+FS_WORKERS = 4
+
+T = TypeVar("T")
+
+
+class StatCache:
+    def __init__(self, ttl: float = STAT_TTL, maxsize: int = STAT_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._cache: dict[str, tuple[Optional[os.stat_result], float]] = {}
+        # Lookups come from the executor's threads.
+        self._lock = threading.Lock()
+
+    def stat(self, path: PathLike | str) -> Optional[os.stat_result]:
+        path = os.fspath(path)
+        now = monotonic()
+        with self._lock:
+            cached = self._cache.get(path)
+        if cached is not None and now - cached[1] < self.ttl:
+            metrics.count("stat_cache.hits")
+            return cached[0]
+        metrics.count("stat_cache.misses")
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        with self._lock:
+            if len(self._cache) >= self.maxsize:
+                self._cache = {
+                    k: v for k, v in self._cache.items() if now - v[1] < self.ttl
+                }
+                if len(self._cache) >= self.maxsize:
+                    self._cache.clear()
+            self._cache[path] = (st, now)
+        return st
+
+    def exists(self, path: PathLike | str) -> bool:
+        return self.stat(path) is not None
+
+    def is_dir(self, path: PathLike | str) -> bool:
+        st = self.stat(path)
+        return st is not None and stat.S_ISDIR(st.st_mode)
+
+
+stat_cache = StatCache()
+_executor = ThreadPoolExecutor(FS_WORKERS, thread_name_prefix="bettergit-fs")
+
+
+async def run_blocking(func: Callable[..., T], *args, **kwargs) -> T:
+    with metrics.timer("fs.offload"):
+        return await asyncio.get_event_loop().run_in_executor(
+            _executor, partial(func, *args, **kwargs)
+        )
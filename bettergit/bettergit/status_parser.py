@@ -0,0 +1,129 @@
+from typing import Optional
+
+LICENSE = """
+Copyright 2023 Dj Padzensky
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software
+without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+
+class StatusParser:
+    # Parses NUL-terminated (-z) git status output incrementally, straight from
+    # the bytes read off the pipe, so memory use doesn't grow with the output.
+    def __init__(self, porcelain_v2: bool, cap: Optional[int] = None):
+        self.porcelain_v2 = porcelain_v2
+        self.cap = cap
+        self.counts = {"untracked": 0, "modified": 0, "staged": 0, "deleted": 0}
+        self.dirty = False
+        self.entries = 0
+        self.capped = False
+        self.oid: Optional[str] = None
+        self.head: Optional[str] = None
+        self.stashes = 0
+        self._partial = b""
+        # Renames and copies are followed by a record holding the original path.
+        self._skip_next = False
+
+    def _tally(self, status: bytes) -> None:
+        counts = self.counts
+        if status == b"??":
+            counts["untracked"] += 1
+        elif status == b"AM":
+            counts["staged"] += 1
+            counts["modified"] += 1
+        elif status == b" M":
+            counts["modified"] += 1
+        elif status == b" D":
+            counts["deleted"] += 1
+        elif status[0:1] in (b"A", b"M", b"D"):
+            counts["staged"] += 1
+
+    def _header(self, record: bytes) -> None:
+        key, _, value = record[2:].decode(errors="replace").partition(" ")
+        if key == "branch.oid":
+            self.oid = value
+        elif key == "branch.head":
+            self.head = value
+        elif key == "stash":
+            self.stashes = int(value)
+
+    def _record(self, record: bytes) -> bool:
+        if self._skip_next:
+            self._skip_next = False
+            return True
+        if not record:
+            return True
+        if self.porcelain_v2:
+            kind = record[0:1]
+            if kind == b"#":
+                self._header(record)
+                return True
+            if kind == b"?":
+                self._tally(b"??")
+            elif kind in (b"1", b"2", b"u"):
+                # Porcelain v2 uses "." where v1 used a space for "unchanged".
+                self._tally(record[2:4].replace(b".", b" "))
+                self._skip_next = kind == b"2"
+            else:
+                return True  # Ignored files
+        else:
+            status = record[0:2]
+            self._tally(status)
+            self._skip_next = b"R" in status or b"C" in status
+        self.dirty = True
+        self.entries += 1
+        if self.cap is not None and self.entries >= self.cap:
+            self.capped = True
+            return False
+        return True
+
+    # Returns False once the cap is reached and the rest can be skipped.
+    def feed(self, chunk: bytes) -> bool:
+        data = self._partial + chunk if self._partial else chunk
+        start = 0
+        while (end := data.find(b"\0", start)) >= 0:
+            if not self._record(data[start:end]):
+                self._partial = b""
+                return False
+            start = end + 1
+        self._partial = data[start:]
+        return True
+
+    def current_branch(self) -> Optional[str]:
+        if self.head == "(detached)":
+            return f"[{self.oid[:7]}]" if self.oid else None  # detached HEAD
+        return self.head
+
+
+class UntrackedParser(StatusParser):
+    # For `git ls-files --others -z`, which lists bare paths.
+    def __init__(self, cap: Optional[int] = None):
+        super().__init__(porcelain_v2=False, cap=cap)
+
+    def _record(self, record: bytes) -> bool:
+        return super()._record(b"?? " + record if record else record)
@@ -0,0 +1,148 @@
+import json
+import os
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import ContextManager, Iterator, Optional
+
+from .logger import logger
+
+LICENSE = """
+Copyright 2023 Dj Padzensky
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software
+without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+TRACE_BUFFER_SIZE = 4096
+# Process output is cut down to this many bytes before it's kept.
+TRACE_OUTPUT_LIMIT = 256
+TRACE_FILE = Path.home() / "Library" / "Caches" / "bettergit" / "trace.json"
+
+
+def _clip(value: any) -> any:
+    if isinstance(value, (bytes, str)) and len(value) > TRACE_OUTPUT_LIMIT:
+        return f"{value[:TRACE_OUTPUT_LIMIT]!r}... ({len(value)} total)"
+    return value
+
+
+def _jsonable(value: any) -> any:
+    if isinstance(value, bytes):
+        return repr(value)
+    if isinstance(value, Path):
+        return str(value)
+    return value
+
+
+class Span:
+    __slots__ = ("name", "session_id", "repo", "start", "duration", "attrs")
+
+    def __init__(self, name: str, session_id: Optional[str], repo, attrs: dict):
+        self.name = name
+        self.session_id = session_id
+        self.repo = repo
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.attrs = {k: _clip(v) for k, v in attrs.items()}
+
+    def set(self, **attrs) -> None:
+        self.attrs.update((k, _clip(v)) for k, v in attrs.items())
+
+    def to_dict(self) -> dict[str, any]:
+        return {
+            "name": self.name,
+            "session": self.session_id,
+            "repo": _jsonable(self.repo),
+            "start": self.start,
+            "duration_ms": (
+                None if self.duration is None else round(self.duration * 1000, 3)
+            ),
+            **{k: _jsonable(v) for k, v in self.attrs.items()},
+        }
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+# Shared by every span taken while tracing is off.
+_NOOP_SPAN_CONTEXT = nullcontext(NOOP_SPAN)
+
+
+class Tracer:
+    def __init__(self, size: int = TRACE_BUFFER_SIZE):
+        self.enabled = False
+        self._spans: deque[Span] = deque(maxlen=size)
+
+    def set_enabled(self, enabled: bool) -> None:
+        if enabled != self.enabled:
+            self.enabled = enabled
+            logger.info("Tracing %s", "enabled" if enabled else "disabled")
+
+    def span(
+        self, name: str, session_id: Optional[str] = None, repo=None, **attrs
+    ) -> ContextManager[Span | _NoopSpan]:
+        if not self.enabled:
+            return _NOOP_SPAN_CONTEXT
+        return self._span(name, session_id, repo, attrs)
+
+    @contextmanager
+    def _span(self, name: str, session_id, repo, attrs: dict) -> Iterator[Span]:
+        span = Span(name, session_id, repo, attrs)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.attrs["error"] = repr(e)
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            self._spans.append(span)
+
+    def event(self, name: str, session_id: Optional[str] = None, repo=None, **attrs):
+        if self.enabled:
+            self._spans.append(Span(name, session_id, repo, attrs))
+
+    def dump(self, path: Path = TRACE_FILE) -> None:
+        spans = [s.to_dict() for s in list(self._spans)]
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{path.name}.tmp")
+            tmp.write_text(json.dumps(spans, indent=1, default=repr), encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("Couldn't write trace to %s: %s", path, e)
+            return
+        logger.info("Wrote %d trace spans to %s", len(spans), path)
+
+
+tracer = Tracer()
@@ -0,0 +1,141 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+from .logger import logger
+from .metrics import metrics
+
+LICENSE = """
+Copyright 2023 Dj Padzensky
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software
+without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+# Per session, at most one push per this many seconds.
+MIN_PUSH_INTERVAL = 0.1
+# How many pushes may be waiting on iTerm2 at once; everything else waits in
+# the pending map, where newer values replace older ones.
+MAX_IN_FLIGHT = 8
+
+Send = Callable[[str, str], Awaitable[None]]
+
+
+class UpdateDispatcher:
+    def __init__(
+        self,
+        send: Send,
+        min_interval: float = MIN_PUSH_INTERVAL,
+        max_in_flight: int = MAX_IN_FLIGHT,
+    ):
+        self.send = send
+        self.min_interval = min_interval
+        self.max_in_flight = max_in_flight
+        self._pending: dict[str, str] = {}
+        self._last_sent: dict[str, str] = {}
+        self._last_sent_at: dict[str, float] = {}
+        self._in_flight = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def backlog(self) -> int:
+        return len(self._pending)
+
+    def submit(self, session_id: str, value: str) -> None:
+        metrics.count("push.submitted")
+        if session_id in self._pending:
+            if self._pending[session_id] == value:
+                metrics.count("push.suppressed")
+                return
+            # Never sent: a newer value replaces it.
+            metrics.count("push.dropped")
+            if self._last_sent.get(session_id) == value:
+                del self._pending[session_id]
+                return
+        elif self._last_sent.get(session_id) == value:
+            metrics.count("push.suppressed")
+            return
+        self._pending[session_id] = value
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def forget(self, session_id: str) -> None:
+        self._pending.pop(session_id, None)
+        self._last_sent.pop(session_id, None)
+        self._last_sent_at.pop(session_id, None)
+
+    async def _send(self, session_id: str, value: str) -> None:
+        try:
+            await self.send(session_id, value)
+        except Exception:
+            metrics.count("push.failed")
+            if self._last_sent.get(session_id) == value:
+                del self._last_sent[session_id]
+            logger.exception("%s: Failed to push update", session_id)
+        else:
+            metrics.count("push.sent")
+        finally:
+            self._in_flight -= 1
+            self._wakeup.set()
+
+    def _take_due(self, now: float) -> tuple[list[tuple[str, str]], Optional[float]]:
+        batch = []
+        next_due = None
+        for session_id in list(self._pending):
+            if self._in_flight + len(batch) >= self.max_in_flight:
+                break
+            due = self._last_sent_at.get(session_id, 0.0) + self.min_interval
+            if due <= now:
+                value = self._pending.pop(session_id)
+                self._last_sent[session_id] = value
+                self._last_sent_at[session_id] = now
+                batch.append((session_id, value))
+            elif next_due is None or due < next_due:
+                next_due = due
+        return batch, next_due
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+        tasks: set[asyncio.Task] = set()
+        while self._pending or tasks:
+            self._wakeup.clear()
+            batch, next_due = self._take_due(loop.time())
+            if batch:
+                metrics.count("push.batches")
+                self._in_flight += len(batch)
+                for session_id, value in batch:
+                    task = asyncio.create_task(self._send(session_id, value))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            timeout = None if next_due is None else max(next_due - loop.time(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
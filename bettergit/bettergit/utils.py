@@ -1,14 +1,116 @@
+import os
+import stat
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from os import PathLike
 from pathlib import Path
+from time import monotonic
 from typing import Optional
 
+from .metrics import metrics
+from .stat_cache import stat_cache
 
-def find_git_root(path: PathLike | str) -> Optional[Path]:
-    p = Path(path)
+RESOLVER_CACHE_SIZE = 512
+# There's no cheap way to notice a repository appearing above a directory, so
+# "not in a repository" is only trusted for this long.
+NEGATIVE_TTL = 2.0
+
+
+@dataclass(frozen=True)
+class RepoPaths:
+    worktree: Path
+    git_dir: Path
+    common_dir: Path
+
+
+def _dot_git_key(dot_git: Path) -> Optional[tuple]:
+    st = stat_cache.stat(dot_git)
+    if st is None:
+        return None
+    if stat.S_ISDIR(st.st_mode):
+        # Directory mtimes change on every index write, so only its identity
+        # matters.
+        return st.st_dev, st.st_ino, True
+    return st.st_dev, st.st_ino, False, st.st_mtime_ns, st.st_size
+
+
+def _read_gitdir_file(dot_git: Path) -> Optional[Path]:
+    try:
+        content = dot_git.read_text(encoding="utf-8").strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+    if not content.startswith("gitdir:"):
+        return None
+    git_dir = Path(content[len("gitdir:") :].strip())
+    if not git_dir.is_absolute():
+        git_dir = dot_git.parent / git_dir
+    return Path(os.path.normpath(git_dir))
+
+
+def _common_dir(git_dir: Path) -> Path:
+    try:
+        common = (git_dir / "commondir").read_text(encoding="utf-8").strip()
+    except (OSError, UnicodeDecodeError):
+        return git_dir
+    common_dir = Path(common)
+    if not common_dir.is_absolute():
+        common_dir = git_dir / common_dir
+    return Path(os.path.normpath(common_dir))
+
+
+def _find_repo(path: Path) -> tuple[Optional[RepoPaths], Optional[tuple]]:
+    p = path
     while True:
-        if (p / ".git").is_dir():
-            return p
+        dot_git = p / ".git"
+        key = _dot_git_key(dot_git)
+        if key is not None:
+            git_dir = dot_git if key[2] else _read_gitdir_file(dot_git)
+            if git_dir is not None:
+                return RepoPaths(p, git_dir, _common_dir(git_dir)), key
         if not p.name:
-            break
+            return None, None
         p = p.parent
-    return None
+
+
+class RepoResolver:
+    def __init__(self, maxsize: int = RESOLVER_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._cache: OrderedDict[Path, tuple] = OrderedDict()
+        # Resolution runs on the filesystem threads.
+        self._lock = threading.Lock()
+
+    def _valid(self, path: Path, cached: tuple) -> bool:
+        repo, key, resolved_at = cached
+        if repo is None:
+            return monotonic() - resolved_at < NEGATIVE_TTL
+        # A repository created anywhere below the one we found takes its place.
+        for p in (path, *path.parents):
+            if p == repo.worktree:
+                break
+            if stat_cache.stat(p / ".git") is not None:
+                return False
+        return _dot_git_key(repo.worktree / ".git") == key
+
+    def resolve(self, path: PathLike | str) -> Optional[RepoPaths]:
+        path = Path(path)
+        with self._lock:
+            cached = self._cache.get(path)
+        if cached is not None and self._valid(path, cached):
+            metrics.count("repo_resolver.hits")
+            with self._lock:
+                if path in self._cache:
+                    self._cache.move_to_end(path)
+            return cached[0]
+        metrics.count("repo_resolver.misses")
+        with metrics.timer("repo_resolver.find_repo"):
+            repo, key = _find_repo(path)
+        with self._lock:
+            self._cache[path] = (repo, key, monotonic())
+            self._cache.move_to_end(path)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return repo
+
+
+repo_resolver = RepoResolver()
@@ -0,0 +1,90 @@
+from typing import TYPE_CHECKING, Callable, Optional
+
+from .config import get_config
+from .logger import logger
+from .metrics import metrics
+
+if TYPE_CHECKING:
+    from iterm2 import App
+
+LICENSE = """
+Copyright 2023 Dj Padzensky
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software
+without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+
+class VisibilityTracker:
+    def __init__(self):
+        self.focused: Optional[str] = None
+        # None until the first focus update, so that nothing is paused before
+        # we know what's on screen.
+        self._visible: Optional[set[str]] = None
+        self._watchers: dict[str, Callable[[], None]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return get_config("pause_hidden_sessions") == 1
+
+    def is_hidden(self, session_id: str) -> bool:
+        if not self.enabled or self._visible is None:
+            return False
+        return session_id != self.focused and session_id not in self._visible
+
+    def update(self, app: "App", focused: Optional[str]) -> None:
+        # Every pane of each window's selected tab is on screen.
+        visible = {
+            session.session_id
+            for window in app.terminal_windows
+            if window.current_tab is not None
+            for session in window.current_tab.sessions
+        }
+        if focused is not None:
+            visible.add(focused)
+        was_hidden = {s for s in self._watchers if self.is_hidden(s)}
+        refocused = focused != self.focused
+        self.focused = focused
+        self._visible = visible
+        if not self.enabled:
+            return
+        for session_id, revalidate in list(self._watchers.items()):
+            if session_id in was_hidden and not self.is_hidden(session_id):
+                logger.debug("%s: Now visible", session_id)
+                metrics.count("visibility.revealed")
+                revalidate()
+            elif refocused and session_id == focused:
+                revalidate()
+
+    def watch(self, session_id: str, revalidate: Callable[[], None]) -> None:
+        self._watchers[session_id] = revalidate
+
+    def unwatch(self, session_id: str) -> None:
+        self._watchers.pop(session_id, None)
+
+
+visibility = VisibilityTracker()
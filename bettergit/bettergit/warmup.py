@@ -0,0 +1,116 @@
+import asyncio
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+from .config import get_config_float
+from .logger import logger
+
+if TYPE_CHECKING:
+    from iterm2 import App
+
+LICENSE = """
+Copyright 2023 Dj Padzensky
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software
+without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+
+class WarmUp:
+    def __init__(self):
+        self._release_at: dict[str, float] = {}
+        self._warmed: dict[Path, asyncio.Event] = {}
+        self._focused: Optional[str] = None
+        self._started = 0.0
+
+    def start(self, app: "App") -> None:
+        # The focused session goes first, then the rest of the panes on
+        # screen, then everything in background tabs, spread over the ramp.
+        focused = None
+        window = app.current_terminal_window
+        if window is not None and window.current_tab is not None:
+            session = window.current_tab.current_session
+            focused = session.session_id if session is not None else None
+        visible, hidden = [], []
+        for window in app.terminal_windows:
+            for tab in window.tabs:
+                for session in tab.sessions:
+                    if session.session_id == focused:
+                        continue
+                    if tab is window.current_tab:
+                        visible.append(session.session_id)
+                    else:
+                        hidden.append(session.session_id)
+        order = ([focused] if focused is not None else []) + visible + hidden
+        ramp = max(get_config_float("startup_ramp_seconds"), 0.0)
+        now = asyncio.get_event_loop().time()
+        self._started = now
+        self._focused = focused
+        self._warmed.clear()
+        self._release_at = {
+            session_id: now + ramp * i / len(order)
+            for i, session_id in enumerate(order)
+        }
+        logger.info(
+            "Warming up %d sessions (%d visible) over %.1fs",
+            len(order),
+            len(visible) + (focused is not None),
+            ramp,
+        )
+
+    async def wait(self, session_id: str, repo_root: Path) -> None:
+        release_at = self._release_at.get(session_id)
+        if release_at is None:
+            return
+        try:
+            delay = release_at - asyncio.get_event_loop().time()
+            if delay <= 0:
+                return
+            # Let the session go early if another one has already warmed up
+            # its repository, since it will be served the same result.
+            warmed = self._warmed.setdefault(repo_root, asyncio.Event())
+            try:
+                await asyncio.wait_for(warmed.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            self._release_at.pop(session_id, None)
+            if not self._release_at:
+                self._warmed.clear()
+
+    def finished(self, session_id: str, repo_root: Path) -> None:
+        if self._release_at:
+            self._warmed.setdefault(repo_root, asyncio.Event()).set()
+        if session_id == self._focused:
+            self._focused = None
+            logger.info(
+                "First render of the focused session after %.3fs",
+                asyncio.get_event_loop().time() - self._started,
+            )
+
+
+warm_up = WarmUp()
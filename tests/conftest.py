@@ -0,0 +1,61 @@
+import asyncio
+import atexit
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "bettergit"))
+
+from bettergit.snapshot import snapshot_store  # noqa: E402
+from bettergit.stat_cache import stat_cache  # noqa: E402
+
+# Tests never write the user's snapshot.
+atexit.unregister(snapshot_store.flush)
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot_store, "path", tmp_path / "snapshot.json")
+    monkeypatch.setattr(snapshot_store, "_repos", {})
+    monkeypatch.setattr(snapshot_store, "_fetch", {})
+    # Files change faster here than any cached stat would notice.
+    monkeypatch.setattr(stat_cache, "ttl", 0.0)
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("GIT_CONFIG_NOSYSTEM", "1")
+    for var in ("GIT_AUTHOR", "GIT_COMMITTER"):
+        monkeypatch.setenv(f"{var}_NAME", "Test")
+        monkeypatch.setenv(f"{var}_EMAIL", "test@example.com")
+
+
+def git(repo: Path, *args: str) -> str:
+    return subprocess.run(
+        ["git", "-C", str(repo), *args], check=True, capture_output=True, text=True
+    ).stdout
+
+
+async def git_async(repo: Path, *args: str) -> tuple[int, str]:
+    proc = await asyncio.create_subprocess_exec(
+        "git",
+        *args,
+        cwd=repo,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+    )
+    stdout, _ = await proc.communicate()
+    return proc.returncode, stdout.decode()
+
+
+@pytest.fixture
+def make_repo(tmp_path):
+    def make(name: str, branch: str = "main", commits: int = 1) -> Path:
+        repo = tmp_path / name
+        git(tmp_path, "init", "-q", "-b", branch, str(repo))
+        for i in range(commits):
+            (repo / "file.txt").write_text(f"{i}\n")
+            git(repo, "add", "file.txt")
+            git(repo, "commit", "-q", "-m", f"commit {i}")
+        return repo
+
+    return make
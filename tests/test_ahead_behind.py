@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from conftest import git, git_async
+
+from bettergit.ahead_behind import INCREMENTAL_THRESHOLD, AheadBehindCache
+from bettergit.metrics import metrics
+
+
+def _commits(repo, prefix: str, count: int) -> None:
+    for i in range(count):
+        (repo / f"{prefix}-{i}.txt").write_text(f"{i}\n")
+        git(repo, "add", f"{prefix}-{i}.txt")
+        git(repo, "commit", "-q", "-m", f"{prefix} {i}")
+
+
+@pytest.fixture
+def diverged(make_repo, tmp_path):
+    origin = make_repo("origin")
+    clone = tmp_path / "clone"
+    git(tmp_path, "clone", "-q", str(origin), str(clone))
+    _commits(origin, "origin", INCREMENTAL_THRESHOLD)
+    _commits(clone, "local", INCREMENTAL_THRESHOLD + 5)
+    git(clone, "fetch", "-q")
+    return origin, clone
+
+
+def test_counts_match_rev_list(diverged):
+    origin, clone = diverged
+    cache = AheadBehindCache()
+
+    async def run_git(*args):
+        return await git_async(clone, *args)
+
+    async def check() -> None:
+        head, upstream = git(clone, "rev-parse", "HEAD", "@{u}").split()
+        expected = tuple(
+            map(
+                int,
+                git(
+                    clone, "rev-list", "--left-right", "--count", "HEAD...@{u}"
+                ).split(),
+            )
+        )
+        counts = await cache.get(run_git, clone / ".git", "main", head, upstream)
+        assert counts == expected
+
+    async def run():
+        await check()
+        incremental = metrics.counters["ahead_behind.incremental"]
+        _commits(clone, "more-local", 3)
+        await check()
+        _commits(origin, "more-origin", 2)
+        git(clone, "fetch", "-q")
+        await check()
+        assert metrics.counters["ahead_behind.incremental"] == incremental + 2
+        git(clone, "reset", "-q", "--hard", "HEAD~4")
+        await check()
+        git(clone, "rebase", "-q", "@{u}")
+        await check()
+        _commits(clone, "after-rebase", 1)
+        await check()
+
+    asyncio.run(run())
+
+
+def test_failed_rev_list_counts_as_in_sync():
+    async def run_git(*args):
+        return 128, "fatal: bad revision"
+
+    counts = asyncio.run(AheadBehindCache().get(run_git, None, "main", "a", "b"))
+    assert counts == (0, 0)
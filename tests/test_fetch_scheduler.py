@@ -0,0 +1,69 @@
+import asyncio
+
+from conftest import git, git_async
+
+from bettergit.fetch_scheduler import FetchScheduler
+
+
+def test_fetch_reports_whether_fetch_head_changed(make_repo, tmp_path):
+    origin = make_repo("origin")
+    clone = tmp_path / "clone"
+    git(tmp_path, "clone", "-q", str(origin), str(clone))
+    scheduler = FetchScheduler()
+
+    async def run_git(*args, fetch=False):
+        return await git_async(clone, *args)
+
+    async def fetch():
+        return await scheduler.fetch(clone / ".git", clone / ".git", "origin", run_git)
+
+    async def run():
+        first = await fetch()
+        unchanged = await fetch()
+        (origin / "new.txt").write_text("new\n")
+        git(origin, "add", "new.txt")
+        git(origin, "commit", "-q", "-m", "new")
+        moved = await fetch()
+        return first, unchanged, moved
+
+    assert asyncio.run(run()) == (True, False, True)
+
+
+def test_only_a_newer_no_op_fetch_elsewhere_skips(make_repo, tmp_path):
+    origin = make_repo("origin")
+    clones = [tmp_path / "a", tmp_path / "b"]
+    for clone in clones:
+        git(tmp_path, "clone", "-q", str(origin), str(clone))
+    scheduler = FetchScheduler()
+
+    def runner(clone):
+        async def run_git(*args, fetch=False):
+            return await git_async(clone, *args)
+
+        return run_git
+
+    async def fetch(clone):
+        git_dir = clone / ".git"
+        return await scheduler.fetch(git_dir, git_dir, "origin", runner(clone))
+
+    async def due(clone):
+        git_dir = clone / ".git"
+        scheduler._state((git_dir, "origin"), None).next_due = 0.0
+        return await scheduler.due_remotes(git_dir, git_dir, runner(clone))
+
+    async def run():
+        a, b = clones
+        await due(a)
+        # A first fetch has nothing to compare against.
+        await fetch(a)
+        first = await due(b)
+        # A no-op fetch only vouches for the time since a's previous one, and b
+        # has never fetched.
+        await fetch(a)
+        never_fetched = await due(b)
+        await fetch(b)
+        await fetch(a)
+        caught_up = await due(b)
+        return first, never_fetched, caught_up
+
+    assert asyncio.run(run()) == (["origin"], ["origin"], [])
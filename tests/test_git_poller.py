@@ -0,0 +1,99 @@
+import asyncio
+import os
+import shutil
+
+import pytest
+from conftest import git
+
+from bettergit.config import get_config_default, set_config
+from bettergit.git_helpers import git_helpers
+from bettergit.git_poller import GitPoller
+from bettergit.metrics import metrics
+from bettergit.utils import RepoPaths, repo_resolver
+
+
+async def _trigger(status):
+    pass
+
+
+def test_status_failure_reports_stderr(tmp_path):
+    not_a_repo = tmp_path / "plain"
+    not_a_repo.mkdir()
+    repo = RepoPaths(not_a_repo, not_a_repo / ".git", not_a_repo / ".git")
+    poller = GitPoller("s", _trigger)
+    with pytest.raises(RuntimeError, match="git status failed: fatal: .*git repo"):
+        asyncio.run(poller.collect_repo_counts(repo))
+
+
+@pytest.fixture
+def absolute_git():
+    git = shutil.which("git")
+    set_config("git_binary", git)
+    yield git
+    set_config("git_binary", get_config_default("git_binary"))
+
+
+def test_concurrent_commands_see_one_environment(make_repo, absolute_git):
+    repo = repo_resolver.resolve(make_repo("repo"))
+    pollers = [GitPoller(f"s{i}", _trigger) for i in range(20)]
+    environ = dict(os.environ)
+    show_env = '!printf "%s|%s|%s" "$PATH" "$GIT_OPTIONAL_LOCKS" "$GIT_TERMINAL_PROMPT"'
+
+    async def one(poller):
+        rc, stdout = await poller._run_git_command(
+            "-c", f"alias.showenv={show_env}", "showenv", repo=repo
+        )
+        assert rc == 0, stdout
+        return stdout
+
+    async def run():
+        return await asyncio.gather(*[one(pollers[i % 20]) for i in range(400)])
+
+    outputs = set(asyncio.run(run()))
+    assert len(outputs) == 1
+    path, optional_locks, terminal_prompt = outputs.pop().split("|")
+    assert os.path.dirname(absolute_git) in path.split(os.pathsep)
+    assert (optional_locks, terminal_prompt) == ("0", "0")
+    assert dict(os.environ) == environ
+
+
+@pytest.fixture
+def helpers():
+    set_config("persistent_git_helpers", True)
+    yield
+    set_config("persistent_git_helpers", get_config_default("persistent_git_helpers"))
+
+
+def test_helper_is_only_asked_for_full_ref_names(make_repo, tmp_path, helpers):
+    origin = make_repo("origin")
+    clone = tmp_path / "clone"
+    git(tmp_path, "clone", "-q", str(origin), str(clone))
+    (clone / "extra.txt").write_text("x\n")
+    git(clone, "add", "extra.txt")
+    git(clone, "commit", "-q", "-m", "extra")
+    git(clone, "branch", "-q", "local")
+    # The .git reader gives up on includes, so git has to find the upstream.
+    (tmp_path / "included").write_text("")
+    git(clone, "config", "include.path", str(tmp_path / "included"))
+    repo = repo_resolver.resolve(clone)
+    poller = GitPoller("s", _trigger)
+
+    async def run():
+        tracked = await poller.collect_counts(repo)
+        git(clone, "checkout", "-q", "local")
+        spawned = metrics.counters["git_helpers.spawned"]
+        processes = metrics.counters["process.spawned"]
+        untracked = [await poller.collect_counts(repo) for _ in range(3)]
+        spawned = metrics.counters["git_helpers.spawned"] - spawned
+        processes = metrics.counters["process.spawned"] - processes
+        for pool in git_helpers._pools.values():
+            for helper in pool:
+                helper.close()
+                await helper.proc.wait()
+        return tracked, untracked, spawned, processes
+
+    tracked, untracked, spawned, processes = asyncio.run(run())
+    assert tracked == {"push_count": 1, "pull_count": 0}
+    assert untracked == [{"push_count": 0, "pull_count": 0}] * 3
+    # One rev-parse to learn the branch has no upstream, and no helper restarts.
+    assert (spawned, processes) == (0, 1)
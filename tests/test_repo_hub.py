@@ -0,0 +1,153 @@
+import asyncio
+
+import pytest
+from conftest import git
+
+from bettergit.fingerprint import repo_fingerprint
+from bettergit.git_poller import GitPoller
+from bettergit.metrics import metrics
+from bettergit.repo_hub import RepoHub, repo_hub
+from bettergit.utils import repo_resolver
+
+
+def _poller(session_id: str, repo) -> GitPoller:
+    async def trigger(status):
+        pass
+
+    poller = GitPoller(session_id, trigger)
+    poller.repo = repo_resolver.resolve(repo)
+    return poller
+
+
+def test_moved_initiator_is_not_shared(make_repo):
+    a = make_repo("a", branch="amain")
+    b = make_repo("b", branch="bmain")
+    for i in range(3):
+        (b / f"untracked-{i}").write_text("x")
+    p = _poller("p", a)
+    q = _poller("q", a)
+    joined = asyncio.Event()
+    supports_porcelain_v2 = p._supports_porcelain_v2
+
+    async def move_then_check(repo):
+        await joined.wait()
+        p.repo = repo_resolver.resolve(b)
+        return await supports_porcelain_v2(repo)
+
+    p._supports_porcelain_v2 = move_then_check
+
+    async def run():
+        p_task = asyncio.create_task(p.collect())
+        while a not in repo_hub._repos or repo_hub._repos[a].in_flight is None:
+            await asyncio.sleep(0.001)
+        q_task = asyncio.create_task(q.collect())
+        await asyncio.sleep(0.1)
+        joined.set()
+        await asyncio.gather(p_task, q_task)
+
+    abandoned = metrics.counters["repo_hub.abandoned"]
+    asyncio.run(run())
+    assert metrics.counters["repo_hub.abandoned"] == abandoned + 1
+    assert q._repo_status.current_branch == "amain"
+    assert q._repo_status.untracked == 0
+    assert repo_hub.peek(a)["current_branch"] == "amain"
+
+
+def test_cancelled_run_is_restarted_for_joiners(make_repo):
+    a = make_repo("a", branch="amain")
+    b = make_repo("b", branch="bmain")
+    p = _poller("p", a)
+    q = _poller("q", a)
+    joined = asyncio.Event()
+
+    async def move_then_cancel(repo):
+        await joined.wait()
+        # What the git scheduler does to the commands of a session that left.
+        p.repo = repo_resolver.resolve(b)
+        raise asyncio.CancelledError
+
+    p._supports_porcelain_v2 = move_then_cancel
+
+    async def run():
+        p_task = asyncio.create_task(p.collect())
+        while a not in repo_hub._repos or repo_hub._repos[a].in_flight is None:
+            await asyncio.sleep(0.001)
+        q_task = asyncio.create_task(q.collect())
+        await asyncio.sleep(0.1)
+        joined.set()
+        await asyncio.gather(p_task, q_task)
+
+    asyncio.run(run())
+    assert q._repo_status.current_branch == "amain"
+    assert q._repo_status.modified == 0
+    assert not q._repo_status.stale
+
+
+def _fingerprint(repo):
+    paths = repo_resolver.resolve(repo)
+    return repo_fingerprint(paths.worktree, paths.git_dir, paths.common_dir)
+
+
+def _commit(repo):
+    (repo / "file.txt").write_text("changed\n")
+    git(repo, "commit", "-q", "-am", "change")
+
+
+def _stash(repo):
+    (repo / "file.txt").write_text("stashed\n")
+    git(repo, "stash", "-q")
+
+
+def _stage(repo):
+    (repo / "file.txt").write_text("staged\n")
+    git(repo, "add", "file.txt")
+
+
+def _move_upstream(repo):
+    git(repo, "update-ref", "refs/remotes/origin/main", "HEAD~1")
+
+
+@pytest.fixture
+def tracking_repo(make_repo, tmp_path):
+    origin = make_repo("origin", commits=2)
+    clone = tmp_path / "clone"
+    git(tmp_path, "clone", "-q", str(origin), str(clone))
+    return clone
+
+
+def test_fingerprint_unchanged(tracking_repo):
+    assert _fingerprint(tracking_repo) == _fingerprint(tracking_repo)
+
+
+@pytest.mark.parametrize("change", [_commit, _stash, _stage, _move_upstream])
+def test_fingerprint_changes(tracking_repo, change):
+    before = _fingerprint(tracking_repo)
+    change(tracking_repo)
+    assert _fingerprint(tracking_repo) != before
+
+
+def test_collect_hits_and_misses(tracking_repo):
+    hub = RepoHub(ttl=0.0)
+    poller = _poller("s", tracking_repo)
+    paths = poller.paths
+
+    async def collect(force=False):
+        hits = metrics.counters["repo_hub.hits"]
+        misses = metrics.counters["repo_hub.misses"]
+        values = await hub.collect(poller, paths, force=force)
+        assert values is not None
+        if metrics.counters["repo_hub.hits"] > hits:
+            return "hit"
+        assert metrics.counters["repo_hub.misses"] == misses + 1
+        return "miss"
+
+    async def run():
+        assert await collect() == "miss"
+        assert await collect() == "hit"
+        assert await collect(force=True) == "miss"
+        assert await collect() == "hit"
+        _commit(tracking_repo)
+        assert await collect() == "miss"
+        assert await collect() == "hit"
+
+    asyncio.run(run())
@@ -0,0 +1,20 @@
+from bettergit.config import get_config
+from bettergit.repo_status import RepoStatus
+
+
+def _counts(**kwargs) -> str:
+    status = RepoStatus(
+        session_id="s", repo_root="/repo", current_branch="main", dirty=True, **kwargs
+    )
+    return status.render()[-1]
+
+
+def test_each_count_shows_its_own_cap():
+    untracked = get_config("icon_untracked_count")
+    staged = get_config("icon_staged_count")
+    rendered = _counts(staged=1, untracked=1, tracked_capped=True)
+    assert f"{staged} 1+" in rendered
+    assert f"{untracked} 1" in rendered and f"{untracked} 1+" not in rendered
+    rendered = _counts(staged=1, untracked=1, untracked_capped=True)
+    assert f"{staged} 1" in rendered and f"{staged} 1+" not in rendered
+    assert f"{untracked} 1+" in rendered
@@ -0,0 +1,112 @@
+import subprocess
+
+import pytest
+from conftest import git
+
+from bettergit.status_parser import StatusParser
+
+
+class LineParser:
+    # The line-based parser StatusParser replaced, kept as a reference.
+    def __init__(self, porcelain_v2: bool):
+        self.porcelain_v2 = porcelain_v2
+        self.counts = {"untracked": 0, "modified": 0, "staged": 0, "deleted": 0}
+        self.dirty = False
+        self.entries = 0
+        self.oid = None
+        self.head = None
+        self.stashes = 0
+
+    def _tally(self, status: str) -> None:
+        counts = self.counts
+        if status == "??":
+            counts["untracked"] += 1
+        elif status == "AM":
+            counts["staged"] += 1
+            counts["modified"] += 1
+        elif status == " M":
+            counts["modified"] += 1
+        elif status == " D":
+            counts["deleted"] += 1
+        elif status[0] in "AMD":
+            counts["staged"] += 1
+
+    def feed_line(self, line: str) -> None:
+        if not line:
+            return
+        if self.porcelain_v2:
+            if line.startswith("# "):
+                key, _, value = line[2:].partition(" ")
+                if key == "branch.oid":
+                    self.oid = value
+                elif key == "branch.head":
+                    self.head = value
+                elif key == "stash":
+                    self.stashes = int(value)
+                return
+            if line.startswith("? "):
+                self._tally("??")
+            elif line[0] in "12u":
+                self._tally(line[2:4].replace(".", " "))
+        else:
+            self._tally(line[0:2])
+        self.dirty = True
+        self.entries += 1
+
+
+@pytest.fixture
+def messy_repo(make_repo):
+    repo = make_repo("messy")
+    git(repo, "config", "status.renames", "copies")
+    names = ["plain.txt", "has space.txt", 'has"quote.txt', "has\nnewline.txt"]
+    names += ["café.txt", "to-rename.txt", "to-copy.txt", "to-delete.txt"]
+    for name in names:
+        (repo / name).write_text(f"{name}\n" * 20)
+    git(repo, "add", ".")
+    git(repo, "commit", "-q", "-m", "files")
+    (repo / "stash.txt").write_text("x")
+    git(repo, "stash", "-q", "-u")
+    git(repo, "mv", "to-rename.txt", "renamed\nwith newline.txt")
+    (repo / "copied.txt").write_text((repo / "to-copy.txt").read_text())
+    # Copies are only detected from a file that's also changed in the index.
+    (repo / "to-copy.txt").write_text("changed\n" * 20)
+    git(repo, "add", "copied.txt", "to-copy.txt")
+    git(repo, "rm", "-q", "to-delete.txt")
+    (repo / "plain.txt").write_text("modified\n")
+    (repo / "has space.txt").unlink()
+    (repo / 'has"quote.txt').write_text("staged then modified\n")
+    git(repo, "add", 'has"quote.txt')
+    (repo / 'has"quote.txt').write_text("modified again\n")
+    (repo / "new\nuntracked.txt").write_text("x")
+    (repo / 'new "untracked".txt').write_text("x")
+    return repo
+
+
+def _status(repo, porcelain_v2: bool, z: bool) -> bytes:
+    args = ["git", "-C", str(repo), "status"]
+    args += ["--porcelain=v2", "--branch", "--show-stash"] if porcelain_v2 else []
+    args += ["--porcelain"] if not porcelain_v2 else []
+    args += ["-z"] if z else []
+    return subprocess.run(args, check=True, capture_output=True).stdout
+
+
+@pytest.mark.parametrize("porcelain_v2", [False, True])
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64 * 1024])
+def test_matches_line_parser(messy_repo, porcelain_v2, chunk_size):
+    expected = LineParser(porcelain_v2)
+    for line in _status(messy_repo, porcelain_v2, z=False).decode().splitlines():
+        expected.feed_line(line)
+    output = _status(messy_repo, porcelain_v2, z=True)
+    kinds = {r[:4] if porcelain_v2 else r[:1] for r in output.split(b"\0")}
+    assert kinds >= ({b"2 R.", b"2 C."} if porcelain_v2 else {b"R", b"C"})
+    parser = StatusParser(porcelain_v2)
+    for i in range(0, len(output), chunk_size):
+        assert parser.feed(output[i : i + chunk_size])
+    assert parser.counts == expected.counts
+    assert (parser.dirty, parser.entries) == (expected.dirty, expected.entries)
+    assert (parser.oid, parser.head, parser.stashes) == (
+        expected.oid,
+        expected.head,
+        expected.stashes,
+    )
+    assert parser.counts["untracked"] == 2
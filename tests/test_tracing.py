@@ -0,0 +1,16 @@
+from bettergit.tracing import TRACE_OUTPUT_LIMIT, Tracer
+
+
+def test_output_is_clipped_when_recorded():
+    tracer = Tracer()
+    tracer.set_enabled(True)
+    output = b"x" * (TRACE_OUTPUT_LIMIT * 100)
+    with tracer.span("process", args=("status",)) as span:
+        span.set(stdout=output, stderr=b"short")
+    tracer.event("status", stdout="y" * (TRACE_OUTPUT_LIMIT * 100))
+    process, event = tracer._spans
+    assert len(process.attrs["stdout"]) < TRACE_OUTPUT_LIMIT * 2
+    assert process.attrs["stdout"].endswith(f"({len(output)} total)")
+    assert process.attrs["stderr"] == b"short"
+    assert len(event.attrs["stdout"]) < TRACE_OUTPUT_LIMIT * 2
+    assert process.to_dict()["stderr"] == "b'short'"
@@ -0,0 +1,22 @@
+from conftest import git
+
+from bettergit.utils import RepoResolver
+
+
+def test_repository_created_below_a_cached_one(make_repo):
+    outer = make_repo("outer")
+    inner = outer / "sub" / "inner"
+    cwd = inner / "deeper"
+    cwd.mkdir(parents=True)
+    resolver = RepoResolver()
+    assert resolver.resolve(cwd).worktree == outer
+    git(outer, "init", "-q", str(inner))
+    assert resolver.resolve(cwd).worktree == inner
+    assert resolver.resolve(outer / "sub").worktree == outer
+
+
+def test_cached_answer_is_reused(make_repo):
+    repo = make_repo("repo")
+    resolver = RepoResolver()
+    first = resolver.resolve(repo / "a" / "b")
+    assert resolver.resolve(repo / "a" / "b") is first
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# Benchmarks a full status refresh against generated repositories.
+#
+#   python3 tools/benchmark.py [--iterations N] [--json out.json] [--compare old.json]
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "bettergit"))
+
+import bettergit.git_poller  # noqa: E402
+from bettergit.ahead_behind import AheadBehindCache  # noqa: E402
+from bettergit.config import set_config  # noqa: E402
+from bettergit.git_poller import GitPoller  # noqa: E402
+from bettergit.metrics import metrics  # noqa: E402
+from bettergit.repo_hub import repo_hub  # noqa: E402
+from bettergit.snapshot import snapshot_store  # noqa: E402
+from bettergit.utils import repo_resolver  # noqa: E402
+
+LICENSE = """
+Copyright 2023 Dj Padzensky
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software
+without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+GIT_ENV = {
+    **os.environ,
+    "GIT_AUTHOR_NAME": "bench",
+    "GIT_AUTHOR_EMAIL": "bench@example.com",
+    "GIT_COMMITTER_NAME": "bench",
+    "GIT_COMMITTER_EMAIL": "bench@example.com",
+    "GIT_CONFIG_GLOBAL": os.devnull,
+    "GIT_CONFIG_NOSYSTEM": "1",
+}
+
+
+def git(repo: Path, *args: str, check: bool = True, stdin: Optional[bytes] = None):
+    return subprocess.run(
+        [set_git_binary.binary, *args],
+        cwd=repo,
+        env=GIT_ENV,
+        input=stdin,
+        check=check,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def set_git_binary(binary: str) -> None:
+    set_git_binary.binary = binary
+    set_config("git_binary", binary)
+
+
+set_git_binary.binary = "git"
+
+
+def write_files(repo: Path, prefix: str, count: int, content: str = "x") -> None:
+    # Spread files over directories so no directory gets too big.
+    for i in range(count):
+        path = repo / prefix / f"d{i // 100}" / f"f{i}.txt"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"{content} {i}\n")
+
+
+def fast_import_history(repo: Path, ref: str, depth: int, parent: str = "") -> None:
+    # Builds a long history in one go; committing one by one takes minutes.
+    stream = []
+    for i in range(depth):
+        data = f"commit {i}\n".encode()
+        stream.append(f"commit {ref}\nmark :{i + 1}\n".encode())
+        stream.append(b"committer bench <bench@example.com> 1700000000 +0000\n")
+        stream.append(b"data %d\n%s" % (len(data), data))
+        if i == 0 and parent:
+            stream.append(f"from {parent}\n".encode())
+        stream.append(
+            f"M 644 inline history/h{i % 50}.txt\ndata <<EOF\n{i}\nEOF\n\n".encode()
+        )
+    git(repo, "fast-import", "--quiet", stdin=b"".join(stream))
+
+
+def init_repo(path: Path, files: int) -> Path:
+    path.mkdir(parents=True)
+    git(path, "init", "-q", "-b", "main")
+    write_files(path, "src", files)
+    git(path, "add", "-A")
+    git(path, "commit", "-q", "-m", "initial")
+    return path
+
+
+def make_working_tree(files: int, modified: float, untracked: float, deleted=0.0):
+    def build(path: Path) -> Path:
+        repo = init_repo(path, files)
+        write_files(repo, "src", int(files * modified), "changed")
+        write_files(repo, "new", int(files * untracked))
+        for i in range(int(files * deleted)):
+            (repo / "src" / f"d{i // 100}" / f"f{i}.txt").unlink(missing_ok=True)
+        return repo
+
+    return build
+
+
+def make_stashes(count: int):
+    def build(path: Path) -> Path:
+        repo = init_repo(path, 200)
+        for i in range(count):
+            (repo / "src" / "d0" / "f0.txt").write_text(f"stash {i}\n")
+            git(repo, "stash", "-q")
+        return repo
+
+    return build
+
+
+def make_history(depth: int):
+    def build(path: Path) -> Path:
+        repo = init_repo(path, 200)
+        fast_import_history(repo, "refs/heads/main", depth, "refs/heads/main^0")
+        git(repo, "reset", "-q", "--hard")
+        return repo
+
+    return build
+
+
+def make_diverged(ahead: int, behind: int):
+    def build(path: Path) -> Path:
+        remote = path.with_name(path.name + "-remote.git")
+        repo = init_repo(path, 200)
+        git(repo, "init", "-q", "--bare", str(remote))
+        git(repo, "remote", "add", "origin", str(remote))
+        git(repo, "push", "-q", "-u", "origin", "main")
+        fast_import_history(repo, "refs/heads/upstream", behind, "refs/heads/main^0")
+        git(repo, "push", "-q", "origin", "upstream:main")
+        git(repo, "branch", "-q", "-D", "upstream")
+        fast_import_history(repo, "refs/heads/main", ahead, "refs/heads/main^0")
+        git(repo, "reset", "-q", "--hard")
+        git(repo, "fetch", "-q")
+        return repo
+
+    return build
+
+
+def make_rebase_in_progress(path: Path) -> Path:
+    repo = init_repo(path, 200)
+    git(repo, "checkout", "-q", "-b", "topic")
+    (repo / "src" / "d0" / "f0.txt").write_text("topic\n")
+    git(repo, "commit", "-q", "-am", "topic")
+    git(repo, "checkout", "-q", "main")
+    (repo / "src" / "d0" / "f0.txt").write_text("main\n")
+    git(repo, "commit", "-q", "-am", "main")
+    git(repo, "checkout", "-q", "topic")
+    git(repo, "rebase", "main", check=False)
+    return repo
+
+
+SCENARIOS: dict[str, Callable[[Path], Path]] = {
+    "clean-100": make_working_tree(100, 0, 0),
+    "dirty-2k": make_working_tree(2000, 0.1, 0.1, 0.02),
+    "large-20k": make_working_tree(20000, 0.01, 0.05),
+    "untracked-heavy": make_working_tree(500, 0, 4),
+    "stashes-20": make_stashes(20),
+    "history-5k": make_history(5000),
+    "diverged-50-80": make_diverged(50, 80),
+    "diverged-2k-3k": make_diverged(2000, 3000),
+    "rebase": make_rebase_in_progress,
+}
+
+
+@dataclass
+class Result:
+    wall_ms: float
+    cpu_ms: float
+    child_cpu_ms: float
+    processes: int
+    py_peak_kib: float
+    child_maxrss_mib: float
+
+    @classmethod
+    def median(cls, results: list["Result"]) -> "Result":
+        return cls(
+            *[
+                statistics.median(getattr(r, f) for r in results)
+                for f in cls.__dataclass_fields__
+            ]
+        )
+
+
+def _child_usage() -> tuple[float, float]:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in bytes on macOS and KiB elsewhere.
+    scale = 1 << 20 if sys.platform == "darwin" else 1 << 10
+    return (usage.ru_utime + usage.ru_stime) * 1000, usage.ru_maxrss / scale
+
+
+async def _noop_trigger(status) -> None:
+    status.render()
+
+
+async def run_scenario(repo: Path, iterations: int, cold: bool) -> list[Result]:
+    poller = GitPoller("bench", _noop_trigger)
+    poller.repo = repo_resolver.resolve(repo)
+    # The first refresh also sets up fetch state and caches version checks.
+    await poller.collect()
+    if poller._fetch_future is not None:
+        await poller._fetch_future
+    results = []
+    for _ in range(iterations):
+        repo_hub.invalidate(poller.repo_root)
+        if cold:
+            bettergit.git_poller.ahead_behind_cache = AheadBehindCache()
+        spawned = metrics.counters["process.spawned"]
+        child_cpu, _ = _child_usage()
+        tracemalloc.start()
+        cpu = time.process_time()
+        wall = time.perf_counter()
+        await poller.collect()
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+        _, py_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        child_cpu_after, child_maxrss = _child_usage()
+        results.append(
+            Result(
+                wall_ms=wall * 1000,
+                cpu_ms=cpu * 1000,
+                child_cpu_ms=child_cpu_after - child_cpu,
+                processes=metrics.counters["process.spawned"] - spawned,
+                py_peak_kib=py_peak / 1024,
+                child_maxrss_mib=child_maxrss,
+            )
+        )
+    poller.repo_root = None
+    return results
+
+
+def print_table(results: dict[str, Result], baseline: dict[str, dict]) -> None:
+    header = f"{'scenario':<16} {'wall ms':>9} {'cpu ms':>8} {'git cpu':>8}"
+    header += f" {'procs':>6} {'py KiB':>8} {'rss MiB':>8}"
+    print(header)
+    for name, r in results.items():
+        line = f"{name:<16} {r.wall_ms:9.1f} {r.cpu_ms:8.1f} {r.child_cpu_ms:8.1f}"
+        line += f" {r.processes:6.0f} {r.py_peak_kib:8.0f} {r.child_maxrss_mib:8.1f}"
+        old = baseline.get(name)
+        if old:
+            change = (r.wall_ms - old["wall_ms"]) / old["wall_ms"] * 100
+            line += (
+                f"   wall {change:+.0f}%, procs {r.processes - old['processes']:+.0f}"
+            )
+        print(line)
+
+
+def run_isolated(name: str, repo: Path, args: argparse.Namespace) -> Result:
+    # A fresh interpreter per scenario keeps caches and the children's peak RSS
+    # from leaking between scenarios.
+    out = subprocess.run(
+        [
+            sys.executable,
+            __file__,
+            "--git",
+            args.git,
+            "--iterations",
+            str(args.iterations),
+            *(["--cold"] if args.cold else []),
+            "--run-one",
+            str(repo),
+        ],
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout
+    return Result(**json.loads(out))
+
+
+async def run_one(repo: Path, iterations: int, cold: bool) -> None:
+    snapshot_store.path = repo.parent / f"{repo.name}-snapshot.json"
+    result = Result.median(await run_scenario(repo, iterations, cold))
+    print(json.dumps(vars(result)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark a full status refresh against generated repositories"
+    )
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--git", default="git", help="git binary to benchmark")
+    parser.add_argument(
+        "--cold", action="store_true", help="drop the ahead/behind cache every time"
+    )
+    parser.add_argument("--json", type=Path, help="write the results here")
+    parser.add_argument("--compare", type=Path, help="results from an earlier run")
+    parser.add_argument(
+        "--keep", type=Path, help="build repositories here and keep them"
+    )
+    parser.add_argument("--run-one", type=Path, help=argparse.SUPPRESS)
+    parser.add_argument("scenarios", nargs="*", metavar="scenario")
+    args = parser.parse_args()
+    set_git_binary(args.git)
+    if args.run_one:
+        asyncio.run(run_one(args.run_one, args.iterations, args.cold))
+        return
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios {', '.join(sorted(unknown))}")
+
+    workdir = args.keep or Path(tempfile.mkdtemp(prefix="bettergit-bench-"))
+    baseline = json.loads(args.compare.read_text()) if args.compare else {}
+    results = {}
+    try:
+        for name in args.scenarios or SCENARIOS:
+            path = workdir / name
+            repo = path if path.exists() else SCENARIOS[name](path)
+            results[name] = run_isolated(name, repo, args)
+    finally:
+        if args.keep is None:
+            shutil.rmtree(workdir)
+    print_table(results, baseline)
+    if args.json:
+        args.json.write_text(
+            json.dumps({k: vars(v) for k, v in results.items()}, indent=1)
+        )
+
+
+if __name__ == "__main__":
+    main()
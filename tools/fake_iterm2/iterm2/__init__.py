@@ -0,0 +1,171 @@
+# A stand-in for the parts of the iTerm2 Python API that bettergit uses, so the
+# plugin can be driven by tools/simulator.py without iTerm2. RPCs are counted
+# and delayed by a fixed latency; prompts and focus changes are injected by the
+# simulator.
+import asyncio
+import enum
+from collections import Counter
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Optional
+
+
+@dataclass
+class Session:
+    session_id: str
+    cwd: Optional[str]
+    connection: "Connection" = field(repr=False, default=None)
+    variables: dict[str, str] = field(default_factory=dict)
+
+    async def async_set_variable(self, name: str, value: str) -> None:
+        await self.connection.rpc("set_variable")
+        self.variables[name] = value
+        await self.connection.variable_changed(self, name, value)
+
+
+@dataclass
+class Tab:
+    tab_id: str
+    sessions: list[Session]
+    current_session: Optional[Session] = None
+
+
+@dataclass
+class Window:
+    window_id: str
+    tabs: list[Tab]
+    current_tab: Optional[Tab] = None
+
+
+class App:
+    def __init__(self, windows: list[Window]):
+        self.terminal_windows = windows
+        self.current_terminal_window = windows[0] if windows else None
+
+    @property
+    def sessions(self) -> list[Session]:
+        return [s for w in self.terminal_windows for t in w.tabs for s in t.sessions]
+
+    def get_session_by_id(self, session_id: str) -> Optional[Session]:
+        return next((s for s in self.sessions if s.session_id == session_id), None)
+
+    def get_tab_by_id(self, tab_id: str) -> Optional[Tab]:
+        tabs = [t for w in self.terminal_windows for t in w.tabs]
+        return next((t for t in tabs if t.tab_id == tab_id), None)
+
+    def get_window_by_id(self, window_id: str) -> Optional[Window]:
+        windows = self.terminal_windows
+        return next((w for w in windows if w.window_id == window_id), None)
+
+
+class Connection:
+    def __init__(self, app: App, rpc_latency: float = 0.0):
+        self.app = app
+        self.rpc_latency = rpc_latency
+        self.rpcs: Counter[str] = Counter()
+        self.knobs: dict[str, any] = {}
+        self.status_bar_callback: Optional[Callable[..., Awaitable]] = None
+        # Called with (session, value, rendered) after each status bar update.
+        self.on_render: Optional[Callable[[Session, str, any], None]] = None
+        self._prompts: dict[str, asyncio.Queue] = {}
+        self._focus: asyncio.Queue = asyncio.Queue()
+        for session in app.sessions:
+            session.connection = self
+
+    async def rpc(self, name: str) -> None:
+        self.rpcs[name] += 1
+        if self.rpc_latency:
+            await asyncio.sleep(self.rpc_latency)
+
+    def prompt_queue(self, session_id: str) -> asyncio.Queue:
+        return self._prompts.setdefault(session_id, asyncio.Queue())
+
+    def prompt(self, session_id: str, cwd: Optional[str] = None) -> None:
+        if cwd is not None:
+            self.app.get_session_by_id(session_id).cwd = cwd
+        self.prompt_queue(session_id).put_nowait(None)
+
+    def focus(self, update: SimpleNamespace) -> None:
+        self._focus.put_nowait(update)
+
+    async def variable_changed(self, session: Session, name: str, value: str) -> None:
+        # iTerm2 re-evaluates the status bar component when a variable it
+        # references changes.
+        if self.status_bar_callback is None:
+            return
+        self.rpcs["status_bar_callback"] += 1
+        rendered = await self.status_bar_callback(
+            knobs=self.knobs, trigger=value, session_id=session.session_id
+        )
+        if self.on_render is not None:
+            self.on_render(session, value, rendered)
+
+
+async def async_get_app(connection: Connection) -> App:
+    await connection.rpc("get_app")
+    return connection.app
+
+
+async def async_get_last_prompt(
+    connection: Connection, session_id: str
+) -> Optional[SimpleNamespace]:
+    await connection.rpc("get_last_prompt")
+    session = connection.app.get_session_by_id(session_id)
+    if session is None:
+        return None
+    return SimpleNamespace(working_directory=session.cwd)
+
+
+class PromptMonitor:
+    def __init__(self, connection: Connection, session_id: str):
+        self.connection = connection
+        self.session_id = session_id
+
+    async def __aenter__(self) -> "PromptMonitor":
+        await self.connection.rpc("subscribe_prompt")
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        pass
+
+    async def async_get(self) -> None:
+        await self.connection.prompt_queue(self.session_id).get()
+
+
+class FocusUpdateWindowChanged:
+    class Reason(enum.Enum):
+        TERMINAL_WINDOW_BECAME_KEY = 0
+        TERMINAL_WINDOW_IS_CURRENT = 1
+        TERMINAL_WINDOW_RESIGNED_KEY = 2
+
+
+class FocusMonitor:
+    def __init__(self, connection: Connection):
+        self.connection = connection
+
+    async def __aenter__(self) -> "FocusMonitor":
+        await self.connection.rpc("subscribe_focus")
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        pass
+
+    async def async_get_next_update(self) -> SimpleNamespace:
+        return await self.connection._focus.get()
+
+
+class EachSessionOnceMonitor:
+    @staticmethod
+    async def async_foreach_session_create_task(
+        app: App, coro: Callable[[str], Awaitable]
+    ) -> None:
+        tasks = [asyncio.create_task(coro(s.session_id)) for s in app.sessions]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def Reference(name: str) -> None:
+    return None
+
+
+def StatusBarRPC(func: Callable) -> Callable:
+    return func
@@ -0,0 +1,29 @@
+from typing import Callable
+
+
+class Knob:
+    def __init__(self, name: str, placeholder, default_value, key: str):
+        self.name = name
+        self.default_value = default_value
+        self.key = key
+
+
+class CheckboxKnob(Knob):
+    def __init__(self, name: str, default_value: bool, key: str):
+        super().__init__(name, None, default_value, key)
+
+
+class StringKnob(Knob):
+    pass
+
+
+class StatusBarComponent:
+    def __init__(self, *, knobs: list[Knob], **kwargs):
+        self.knobs = knobs
+        self.kwargs = kwargs
+
+    async def async_register(self, connection, callback: Callable) -> None:
+        await connection.rpc("register_status_bar")
+        for knob in self.knobs:
+            connection.knobs.setdefault(knob.key, knob.default_value)
+        connection.status_bar_callback = callback
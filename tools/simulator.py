@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# Runs the plugin against a stand-in iTerm2 with many simulated sessions and
+# reports event loop lag, prompt-to-render latency and RPC counts.
+#
+#   python3 tools/simulator.py tools/scenarios/many-sessions.json [--json out.json]
+#       [--set knob=value ...] [--compare old.json]
+import argparse
+import asyncio
+import atexit
+import json
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional
+
+TOOLS = Path(__file__).resolve().parent
+sys.path.insert(0, str(TOOLS / "fake_iterm2"))
+sys.path.insert(0, str(TOOLS.parent / "bettergit"))
+
+import iterm2  # noqa: E402
+from benchmark import SCENARIOS as REPO_BUILDERS  # noqa: E402
+from benchmark import set_git_binary  # noqa: E402
+from bettergit.config import set_config  # noqa: E402
+from bettergit.main import main as plugin_main  # noqa: E402
+from bettergit.metrics import metrics  # noqa: E402
+from bettergit.snapshot import snapshot_store  # noqa: E402
+
+LICENSE = """
+Copyright 2023 Dj Padzensky
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+Redistributions of source code must retain the above copyright notice,
+this list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice,
+this list of conditions and the following disclaimer in the documentation
+and/or other materials provided with the distribution.
+
+Neither the name of the copyright holder nor the names of its contributors
+may be used to endorse or promote products derived from this software
+without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS “AS IS”
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+LAG_PROBE_INTERVAL = 0.05
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(p: float) -> float:
+        return round(ordered[min(int(p * len(ordered)), len(ordered) - 1)] * 1000, 1)
+
+    return {
+        "count": len(ordered),
+        "p50_ms": pick(0.5),
+        "p90_ms": pick(0.9),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+class Simulation:
+    def __init__(self, scenario: dict, workdir: Path):
+        self.scenario = scenario
+        self.workdir = workdir
+        self.repos: dict[Optional[str], Path] = {None: workdir / "not-a-repo"}
+        self.cwds: dict[str, list[Optional[str]]] = {}
+        self.behaviour: dict[str, dict] = {}
+        self.started = 0.0
+        self.pending: dict[str, float] = {}
+        self.first_render: dict[str, float] = {}
+        self.latencies: list[float] = []
+        self.lags: list[float] = []
+        self.prompts = 0
+        self.unchanged = 0
+        self.renders = 0
+        self.edits = 0
+
+    def build_repos(self) -> None:
+        self.repos[None].mkdir(parents=True, exist_ok=True)
+        for name in self.scenario["repos"]:
+            path = self.workdir / name
+            self.repos[name] = path if path.exists() else REPO_BUILDERS[name](path)
+
+    def build_app(self) -> iterm2.App:
+        sessions = []
+        for group in self.scenario["sessions"]:
+            for _ in range(group["count"]):
+                session_id = f"s{len(sessions)}"
+                self.cwds[session_id] = group["cwds"]
+                self.behaviour[session_id] = group
+                cwd = random.choice(group["cwds"])
+                sessions.append(iterm2.Session(session_id, str(self.repos[cwd])))
+        per_tab = self.scenario.get("panes_per_tab", 4)
+        tabs = [
+            iterm2.Tab(f"t{i}", sessions[i : i + per_tab], sessions[i])
+            for i in range(0, len(sessions), per_tab)
+        ]
+        per_window = self.scenario.get("tabs_per_window", 10)
+        windows = [
+            iterm2.Window(f"w{i}", tabs[i : i + per_window], tabs[i])
+            for i in range(0, len(tabs), per_window)
+        ]
+        return iterm2.App(windows)
+
+    @staticmethod
+    def cpu_ms() -> tuple[float, float]:
+        # Ours, and that of the git processes we've waited for.
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return time.process_time() * 1000, (usage.ru_utime + usage.ru_stime) * 1000
+
+    def rendered(self, session: iterm2.Session, value: str, result) -> None:
+        now = time.monotonic()
+        self.renders += 1
+        if result:
+            self.first_render.setdefault(session.session_id, now - self.started)
+        prompted_at = self.pending.pop(session.session_id, None)
+        if prompted_at is not None:
+            self.latencies.append(now - prompted_at)
+
+    def edit(self, session: iterm2.Session) -> None:
+        repo = Path(session.cwd)
+        if repo == self.repos[None]:
+            return
+        self.edits += 1
+        (repo / f"sim-{random.randrange(20)}.txt").write_text(f"{time.time()}\n")
+
+    async def drive(self, connection: iterm2.Connection, session: iterm2.Session):
+        group = self.behaviour[session.session_id]
+        while True:
+            await asyncio.sleep(random.expovariate(1 / group["prompt_interval"]))
+            cwd = None
+            if random.random() < group.get("cd_probability", 0.0):
+                cwd = str(self.repos[random.choice(self.cwds[session.session_id])])
+            if random.random() < group.get("edit_probability", 0.0):
+                self.edit(session)
+            self.prompts += 1
+            if session.session_id in self.pending:
+                # The last prompt didn't change what the status bar shows.
+                self.unchanged += 1
+            self.pending[session.session_id] = time.monotonic()
+            connection.prompt(session.session_id, cwd)
+
+    async def move_focus(self, connection: iterm2.Connection, app: iterm2.App):
+        rate = self.scenario.get("focus_changes_per_minute", 0)
+        while rate:
+            await asyncio.sleep(random.expovariate(rate / 60))
+            window = random.choice(app.terminal_windows)
+            window.current_tab = random.choice(window.tabs)
+            session = random.choice(window.current_tab.sessions)
+            window.current_tab.current_session = session
+            app.current_terminal_window = window
+            connection.focus(
+                SimpleNamespace(
+                    active_session_changed=SimpleNamespace(
+                        session_id=session.session_id
+                    ),
+                    selected_tab_changed=None,
+                    window_changed=None,
+                )
+            )
+
+    async def probe_lag(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            self.lags.append(max(loop.time() - start - LAG_PROBE_INTERVAL, 0.0))
+
+    async def run(self) -> dict:
+        app = self.build_app()
+        connection = iterm2.Connection(
+            app, self.scenario.get("rpc_latency_ms", 0) / 1000
+        )
+        connection.on_render = self.rendered
+        for key, value in self.scenario.get("knobs", {}).items():
+            connection.knobs[key] = value
+            set_config(key, value)
+        self.started = time.monotonic()
+        cpu, git_cpu = self.cpu_ms()
+        tasks = [
+            asyncio.create_task(plugin_main(connection)),
+            asyncio.create_task(self.probe_lag()),
+            asyncio.create_task(self.move_focus(connection, app)),
+            *[asyncio.create_task(self.drive(connection, s)) for s in app.sessions],
+        ]
+        await asyncio.sleep(self.scenario["duration"])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        cpu_after, git_cpu_after = self.cpu_ms()
+        return {
+            "sessions": len(app.sessions),
+            "prompts": self.prompts,
+            "unchanged_prompts": self.unchanged,
+            "edits": self.edits,
+            "renders": self.renders,
+            "prompt_to_render": percentiles(self.latencies),
+            "first_render": percentiles(list(self.first_render.values())),
+            "loop_lag": percentiles(self.lags),
+            "rpcs": dict(connection.rpcs),
+            "git_processes": metrics.counters["process.spawned"],
+            "cpu_ms": round(cpu_after - cpu),
+            "git_cpu_ms": round(git_cpu_after - git_cpu),
+            "visibility": metrics.group("visibility."),
+            "metrics": metrics.snapshot(),
+        }
+
+
+def print_report(report: dict, baseline: Optional[dict]) -> None:
+    def line(name: str, stats: dict) -> str:
+        if not stats["count"]:
+            return f"{name:<18} no samples"
+        return (
+            f"{name:<18} n={stats['count']:<6} p50 {stats['p50_ms']:>7}ms"
+            f"  p90 {stats['p90_ms']:>7}ms  p99 {stats['p99_ms']:>7}ms"
+            f"  max {stats['max_ms']:>7}ms"
+        )
+
+    print(
+        f"{report['sessions']} sessions, {report['prompts']} prompts"
+        f" ({report['unchanged_prompts']} unchanged), {report['edits']} edits,"
+        f" {report['renders']} renders, {report['git_processes']} git processes"
+    )
+    print(f"CPU: {report['cpu_ms']}ms plugin, {report['git_cpu_ms']}ms git")
+    print(line("prompt to render", report["prompt_to_render"]))
+    print(line("first render", report["first_render"]))
+    print(line("event loop lag", report["loop_lag"]))
+    rpcs = ", ".join(f"{k} {v}" for k, v in sorted(report["rpcs"].items()))
+    print(f"RPCs: {rpcs}")
+    if report["visibility"]:
+        paused = ", ".join(f"{k} {v}" for k, v in sorted(report["visibility"].items()))
+        print(f"Background tabs: {paused}")
+    if baseline:
+
+        def change(key: str, unit: str = "") -> str:
+            old, new = baseline[key], report[key]
+            pct = f" ({(new - old) / old * 100:+.0f}%)" if old else ""
+            return f"{new - old:+}{unit}{pct}"
+
+        print(
+            f"Against baseline: git processes {change('git_processes')},"
+            f" plugin CPU {change('cpu_ms', 'ms')}, git CPU {change('git_cpu_ms', 'ms')}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Drive the plugin with simulated iTerm2 sessions"
+    )
+    parser.add_argument("scenario", type=Path)
+    parser.add_argument("--git", default="git", help="git binary to use")
+    parser.add_argument("--json", type=Path, help="write the report here")
+    parser.add_argument(
+        "--keep", type=Path, help="build repositories here and keep them"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KNOB=VALUE",
+        help="override one of the scenario's knobs",
+    )
+    parser.add_argument("--compare", type=Path, help="report from an earlier run")
+    args = parser.parse_args()
+    scenario = json.loads(args.scenario.read_text())
+    for override in args.set:
+        key, _, value = override.partition("=")
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+        scenario.setdefault("knobs", {})[key] = value
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    random.seed(args.seed)
+    set_git_binary(args.git)
+
+    workdir = args.keep or Path(tempfile.mkdtemp(prefix="bettergit-sim-"))
+    snapshot_store.path = workdir / "snapshot.json"
+    simulation = Simulation(scenario, workdir)
+    try:
+        simulation.build_repos()
+        report = asyncio.run(simulation.run())
+    finally:
+        if args.keep is None:
+            atexit.unregister(snapshot_store.flush)
+            shutil.rmtree(workdir)
+    print_report(report, baseline)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=1))
+
+
+if __name__ == "__main__":
+    main()